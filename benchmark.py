@@ -0,0 +1,231 @@
+# coding: utf-8
+"""
+    Benchmarks of safe.
+
+    Run all benchmarks and save the results::
+
+        $ python benchmark.py -o results.json
+
+    Compare with the results of another commit, it exits with 1 when
+    any benchmark is slower than the threshold::
+
+        $ python benchmark.py --compare baseline.json --threshold 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import tempfile
+
+import safe
+
+# values of these metrics are better when higher
+HIGHER_IS_BETTER = ('throughput',)
+
+
+def corpus(size=20000, seed=42):
+    """A synthetic corpus of passwords, mixing common words and their
+    variations, keyboard walks, sequences and random strings.
+    """
+    rnd = random.Random(seed)
+    words = [w for w, _ in sorted(
+        safe._load_words(cache_words=False).items(),
+        key=lambda item: -item[1],
+    )]
+    walks = ['qwerty', '1qaz2wsx', 'asdfgh', 'zxcvbnm', '7896321']
+    alphabet = (
+        'abcdefghijklmnopqrstuvwxyz'
+        'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$%^&*.-_'
+    )
+    leet = {'a': '@', 'o': '0', 'e': '3', 's': '$', 'i': '1'}
+
+    passwords = []
+    for _ in range(size):
+        kind = rnd.random()
+        # common words are ranked in a zipf-like distribution
+        word = words[int(rnd.paretovariate(1.2)) % len(words)]
+        if kind < 0.3:
+            password = word
+        elif kind < 0.5:
+            password = word.capitalize() + str(rnd.randint(0, 2030))
+        elif kind < 0.6:
+            password = ''.join(leet.get(c, c) for c in word) + '!'
+        elif kind < 0.7:
+            password = rnd.choice(walks) + rnd.choice(walks)
+        else:
+            length = rnd.randint(6, 16)
+            password = ''.join(rnd.choice(alphabet) for _ in range(length))
+        passwords.append(password)
+    return passwords
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    result = {}
+    for p in (50, 90, 99):
+        index = min(len(samples) - 1, int(len(samples) * p / 100.0))
+        result['p%d' % p] = samples[index] * 1e6
+    return result
+
+
+def bench_latency(passwords, **options):
+    """Latency of single checks in microseconds."""
+    safe.preload()
+    timer = time.perf_counter
+    samples = []
+    for raw in passwords:
+        start = timer()
+        safe.check(raw, **options)
+        samples.append(timer() - start)
+    return _percentiles(samples)
+
+
+def bench_policy(passwords):
+    """Latency of single calls of a policy in microseconds."""
+    policy = safe.Policy()
+    policy('warmup')
+    timer = time.perf_counter
+    samples = []
+    for raw in passwords:
+        start = timer()
+        policy(raw)
+        samples.append(timer() - start)
+    return _percentiles(samples)
+
+
+def bench_batch(passwords, batch_size):
+    """Throughput of check_many in passwords per second."""
+    safe.preload()
+    start = time.perf_counter()
+    for i in range(0, len(passwords), batch_size):
+        safe.check_many(passwords[i:i + batch_size])
+    return {'throughput': len(passwords) / (time.perf_counter() - start)}
+
+
+_STARTUP = '''
+import time, resource
+start = time.perf_counter()
+import safe
+imported = time.perf_counter()
+safe.check('x*V-92Ba')
+checked = time.perf_counter()
+print('%f %f %d' % (
+    (imported - start) * 1e3,
+    (checked - start) * 1e3,
+    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+))
+'''
+
+
+def bench_startup(cold, repeat=5):
+    """Milliseconds from import to the first check in a new process, and
+    the peak RSS of the process in KiB. A cold start has no cache files.
+    """
+    cache = os.path.join(tempfile.mkdtemp(), 'safe.words.cache')
+    env = dict(os.environ, PYTHON_SAFE_WORDS_CACHE=cache)
+    root = os.path.dirname(os.path.abspath(__file__))
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+
+    def start():
+        output = subprocess.check_output(
+            [sys.executable, '-c', _STARTUP], env=env,
+        )
+        return [float(v) for v in output.split()]
+
+    if not cold:
+        # build the cache files
+        start()
+
+    results = []
+    for _ in range(repeat):
+        if cold:
+            for filename in (cache, cache + '.ac'):
+                if os.path.exists(filename):
+                    os.remove(filename)
+        results.append(start())
+
+    # median of every metric
+    imported, checked, rss = [
+        sorted(values)[len(values) // 2] for values in zip(*results)
+    ]
+    return {'import': imported, 'first_check': checked, 'rss': rss}
+
+
+def run(size):
+    passwords = corpus(size)
+    return {
+        'check': bench_latency(passwords),
+        'check_guesses': bench_latency(passwords[:size // 4], guesses=True),
+        'policy': bench_policy(passwords),
+        'batch_100': bench_batch(passwords, 100),
+        'batch_10000': bench_batch(passwords, 10000),
+        'startup_cold': bench_startup(cold=True),
+        'startup_warm': bench_startup(cold=False),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the changes against the baseline, and return the names of
+    regressed metrics."""
+    regressions = []
+    for name, metrics in sorted(results.items()):
+        for metric, value in sorted(metrics.items()):
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                continue
+            change = (value - old) / float(old)
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressions.append('%s.%s' % (name, metric))
+            print('%-14s %-12s %12.2f %12.2f %+7.1f%%%s' % (
+                name, metric, old, value, change * 100, flag,
+            ))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of safe.')
+    parser.add_argument('-o', '--output', help='save results into a file')
+    parser.add_argument('--compare', help='compare with saved results')
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='ratio of slowdown to be a regression, defaults to 0.1',
+    )
+    parser.add_argument(
+        '--size', type=int, default=20000,
+        help='number of passwords in the corpus',
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.size)
+    document = {
+        'version': safe.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+    else:
+        json.dump(document, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,79 +8,409 @@
     :copyright: (c) 2014 by Hsiaoming Yang
 """
 
-import re
-import logging
+import sys
+import time
+import threading
+import itertools
+from array import array
+from collections import Counter, OrderedDict
 import os.path
-import tempfile
-from ._compat import to_unicode, pickle
+from ._compat import to_unicode
+from .wordlist import MappedWords, read_words, compile_words
+from .keyboard import walk_coverage
+from .dictionary import Automaton
+from . import metrics
 
 __version__ = '0.4'
 __author__ = 'Hsiaoming Yang <me@lepture.com>'
 
 __all__ = [
     'is_asdf', 'is_by_step', 'is_common_password',
-    'check', 'Strength',
+    'check', 'check_many', 'Strength', 'Batch', 'preload', 'reload',
+    'watch',
+    'char_types', 'count_types', 'Policy', 'VerdictCache',
+    'IncrementalChecker',
 ]
 
-log = logging.getLogger('safe')
 
-LOWER = re.compile(r'[a-z]')
-UPPER = re.compile(r'[A-Z]')
-NUMBER = re.compile(r'[0-9]')
-MARKS = re.compile(r'[^0-9a-zA-Z]')
+
+class _Logger(object):
+    """The logger of safe, logging is imported on first use. Debug
+    messages are dropped when logging is not imported, since nothing is
+    configured to show them.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def debug(self, msg, *args):
+        if 'logging' in sys.modules:
+            self._logger().debug(msg, *args)
+
+    def _logger(self):
+        import logging
+        return logging.getLogger(self.name)
+
+    def __getattr__(self, name):
+        return getattr(self._logger(), name)
+
+
+log = _Logger('safe')
+
+# the clock of timings in metrics
+_timer = getattr(time, 'perf_counter', time.time)
+
+# regexes of character families, they are compiled on first access
+_PATTERNS = {
+    'LOWER': r'[a-z]',
+    'UPPER': r'[A-Z]',
+    'NUMBER': r'[0-9]',
+    'MARKS': r'[^0-9a-zA-Z]',
+}
+
+# character family bits
+TYPE_LOWER = 1
+TYPE_UPPER = 2
+TYPE_NUMBER = 4
+TYPE_MARKS = 8
+
+# every character family is translated into a single character, and
+# other characters are marks
+_FAMILIES = dict(
+    [(ord(c), u'a') for c in 'abcdefghijklmnopqrstuvwxyz'] +
+    [(ord(c), u'A') for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'] +
+    [(ord(c), u'0') for c in '0123456789']
+)
+_FAMILY_BITS = {u'a': TYPE_LOWER, u'A': TYPE_UPPER, u'0': TYPE_NUMBER}
+_POPCOUNT = [bin(i).count('1') for i in range(16)]
 
 TERRIBLE = 0
 SIMPLE = 1
 MEDIUM = 2
 STRONG = 3
 
+LEVELS = ('terrible', 'simple', 'medium', 'strong')
 
-def _load_words(cache_words=True):
-    if cache_words:
-        filename = 'safe-%s.words.cache' % __version__
-        _cache_file = os.environ.get(
-            'PYTHON_SAFE_WORDS_CACHE',
-            os.path.join(tempfile.gettempdir(), filename),
-        )
+# message codes, shared by check and check_many
+TOO_SHORT = 0
+HAS_PATTERN = 1
+TOO_COMMON = 2
+TOO_SIMPLE = 3
+NOT_STRONG = 4
+PERFECT = 5
+# message codes of estimated guesses, see safe.scoring
+GUESS_TERRIBLE = 6
+GUESS_SIMPLE = 7
+GUESS_MEDIUM = 8
+TOO_LONG = 9
+
+# (strength level, message, always invalid) of each message code
+MESSAGES = (
+    (TERRIBLE, 'password is too short', True),
+    (SIMPLE, 'password has a pattern', True),
+    (SIMPLE, 'password is too common', True),
+    (SIMPLE, 'password is too simple', False),
+    (MEDIUM, 'password is good enough, but not strong', False),
+    (STRONG, 'password is perfect', False),
+    (TERRIBLE, 'password is very easy to guess', False),
+    (SIMPLE, 'password is easy to guess', False),
+    (MEDIUM, 'password is hard to guess, but not strong', False),
+    (TERRIBLE, 'password is too long', True),
+)
+
+# names of message codes in metrics
+CODE_NAMES = (
+    'too_short', 'has_pattern', 'too_common', 'too_simple', 'not_strong',
+    'perfect', 'guess_terrible', 'guess_simple', 'guess_medium', 'too_long',
+)
+
+# log10 guesses needed by simple, medium and strong levels
+GUESS_LEVELS = (3, 6, 8)
+
+
+def _cache_path():
+    filename = os.environ.get('PYTHON_SAFE_WORDS_CACHE')
+    if filename:
+        return filename
+    import hashlib
+    import tempfile
+    # words files, e.g. of two installs, have cache files of their own
+    source = os.path.abspath(_words_file())
+    if not isinstance(source, bytes):
+        source = source.encode('utf-8')
+    name = '%s-%s' % (__version__, hashlib.sha1(source).hexdigest()[:8])
+    if hasattr(os, 'getuid'):
+        # cache files of other users in a shared temp directory are
+        # neither trusted nor writable
+        name = '%s-%d' % (name, os.getuid())
+    filename = 'safe-%s.words.cache' % name
+    return os.path.join(tempfile.gettempdir(), filename)
 
-        if os.path.exists(_cache_file):
-            log.debug('Reading from cache file %s' % _cache_file)
-            try:
-                with open(_cache_file, 'rb') as f:
-                    return pickle.load(f)
-            except:
-                pass
 
-    filepath = os.environ.get(
+def _words_file():
+    return os.environ.get(
         'PYTHON_SAFE_WORDS_FILE',
         os.path.join(os.path.dirname(__file__), 'words.dat'),
     )
-    words = {}
-    with open(filepath, 'rb') as f:
-        for line in f.readlines():
-            name, freq = line.split()
-            words[to_unicode(name.strip())] = int(freq.strip())
-    if cache_words:
-        with open(_cache_file, 'wb') as f:
-            log.debug('Dump to cache file %s' % _cache_file)
-            pickle.dump(words, f)
-    return words
-
-WORDS = {}
+
+
+def _load_words(cache_words=True):
+    shm_name = os.environ.get('PYTHON_SAFE_WORDS_SHM')
+    if shm_name:
+        from .shared import SharedWords
+        log.debug('Attaching to shared words %s' % shm_name)
+        return SharedWords.attach(shm_name)
+
+    filepath = _words_file()
+    if not cache_words:
+        return read_words(filepath)
+
+    def build():
+        words = read_words(filepath)
+        return words, lambda f: compile_words(words, f)
+
+    from . import cache
+    key = cache.source_key(filepath, __version__, 'words')
+    return cache.load('words', _cache_path(), key, MappedWords, build)
+
+
+def _derived_cache(words, name, suffix):
+    """The path and the key of the cache file of a value built from the
+    words, e.g. the automaton. Words attached from shared memory may be
+    another list than the words file, they are keyed by their content,
+    in cache files of their own.
+    """
+    from . import cache
+    filename = _cache_path() + suffix
+    if not os.environ.get('PYTHON_SAFE_WORDS_SHM'):
+        key = cache.source_key(_words_file(), __version__, name)
+        return filename, key
+
+    import hashlib
+    digest = hashlib.sha1(words._buf).digest()
+    extra = ('\0%s\0%s' % (__version__, name)).encode('utf-8')
+    return filename + '.shm', hashlib.sha1(digest + extra).digest()
+
+
+def _load_automaton(cache_words=True, words=None):
+    if words is None:
+        words = _wordlist.get(cache_words)
+    if not cache_words:
+        return Automaton.build(dict(words.items()))
+
+    def build():
+        automaton = Automaton.build(dict(words.items()))
+        return automaton, automaton.save
+
+    from . import cache
+    filename, key = _derived_cache(words, 'automaton', '.ac')
+    return cache.load(
+        'automaton', filename, key, Automaton.from_buffer, build
+    )
+
+
+def _load_trie(cache_words=True, words=None):
+    from .trie import Trie
+    if words is None:
+        words = _wordlist.get(cache_words)
+    if not cache_words:
+        return Trie.build(dict(words.items()))
+
+    def build():
+        trie = Trie.build(dict(words.items()))
+        return trie, trie.save
+
+    from . import cache
+    filename, key = _derived_cache(words, 'trie', '.trie')
+    return cache.load('trie', filename, key, Trie.from_buffer, build)
+
+
+class _Lazy(object):
+    """Holder of a value which is loaded lazily on first use, e.g. the
+    bundled words. Loading is protected by a lock, so concurrent threads
+    share a single load.
+
+    :param load: the loader, it is called with ``cache_words``.
+    :param name: name of the value in metrics.
+    """
+    def __init__(self, load, name=None):
+        self.name = name or load.__name__
+        self.value = None
+        self.seconds = None
+        # increased when the value is swapped by a reload
+        self.generation = 0
+        self._load = load
+        self._lock = threading.Lock()
+
+    def get(self, cache_words=True):
+        value = self.value
+        if value is None:
+            with self._lock:
+                if self.value is None:
+                    start = time.time()
+                    value = self._load(cache_words)
+                    self.seconds = time.time() - start
+                    log.debug('Loaded %s in %.3fs' % (
+                        self.name, self.seconds
+                    ))
+                    metrics.timing('load.' + self.name, self.seconds)
+                    self.value = value
+                value = self.value
+        return value
+
+    def swap(self, value):
+        """Replace the value, readers get either the old or the new one."""
+        with self._lock:
+            self.value = value
+            self.generation += 1
+
+
+_wordlist = _Lazy(_load_words, 'words')
+_automaton = _Lazy(_load_automaton, 'automaton')
+_trie = _Lazy(_load_trie, 'trie')
+
+
+def preload(cache_words=True):
+    """Load the bundled words now instead of on the first check. Call it
+    in a server hook, e.g. before forking workers so that they share the
+    loaded pages. It is safe to call it many times and from many threads.
+
+    It returns the number of words and the seconds spent on loading::
+
+        >>> safe.preload()
+        {'count': 10000, 'seconds': 0.0012}
+
+    :param cache_words: cache the bundled words in a compiled file.
+    """
+    words = _wordlist.get(cache_words)
+    _automaton.get(cache_words)
+    seconds = (_wordlist.seconds or 0) + (_automaton.seconds or 0)
+    return {'count': len(words), 'seconds': seconds}
+
+
+_reload_lock = threading.Lock()
+
+
+def reload(cache_words=True):
+    """Load the words again, e.g. after ``PYTHON_SAFE_WORDS_FILE`` is
+    modified. The new words are built in the calling thread, and swapped
+    in when they are ready, checks running meanwhile use the old words
+    without waiting.
+
+    It returns the number of words, the change of the number, and the
+    seconds spent on reloading::
+
+        >>> safe.reload()
+        {'count': 10120, 'delta': 120, 'seconds': 0.35}
+
+    :param cache_words: cache the bundled words in a compiled file.
+    """
+    with _reload_lock:
+        start = _timer()
+        old = _wordlist.value
+        words = _load_words(cache_words)
+        automaton = None
+        if _automaton.value is not None:
+            automaton = _load_automaton(cache_words, words)
+        trie = None
+        if _trie.value is not None:
+            trie = _load_trie(cache_words, words)
+        _wordlist.swap(words)
+        if automaton is not None:
+            _automaton.swap(automaton)
+        if trie is not None:
+            _trie.swap(trie)
+        seconds = _timer() - start
+
+    count = len(words)
+    delta = count - (len(old) if old is not None else 0)
+    log.info('Reloaded %d words (%+d) in %.3fs' % (count, delta, seconds))
+    metrics.timing('reload.words', seconds)
+    return {'count': count, 'delta': delta, 'seconds': seconds}
+
+
+class Watcher(object):
+    """A daemon thread polling the modified time of the words file, the
+    words are reloaded when it is modified. See :meth:`watch`.
+    """
+    def __init__(self, interval=5.0, cache_words=True, callback=None):
+        self.interval = interval
+        self.cache_words = cache_words
+        self.callback = callback
+        self._source = self._stat()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='safe-watch')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _stat(self):
+        filepath = _words_file()
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return filepath, stat.st_size, stat.st_mtime
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            source = self._stat()
+            if source is None or source == self._source:
+                continue
+            try:
+                info = reload(self.cache_words)
+            except Exception:
+                # e.g. the file is still being written, retry next time
+                log.exception('Failed to reload words')
+                continue
+            self._source = source
+            if self.callback is not None:
+                self.callback(info)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+def watch(interval=5.0, cache_words=True, callback=None):
+    """Reload the words in a background thread when the words file is
+    modified, it returns a :class:`Watcher`, call its ``stop`` method to
+    stop watching.
+
+    :param interval: seconds between polls of the file.
+    :param cache_words: cache the bundled words in a compiled file.
+    :param callback: called with the result of :meth:`reload`.
+    """
+    return Watcher(interval, cache_words, callback)
+
+
 ASDF = ['qwertyuiop', 'asdfghjkl', 'zxcvbnm']
+_ASDF = ''.join(ASDF)
+
+# passwords covered by keyboard walks over this ratio have a pattern
+WALK_RATIO = 0.8
+
+# passwords covered by common words over this ratio are too common, the
+# check is disabled by default, pass it as ``word_ratio`` to enable it
+WORD_RATIO = 0.6
+
+# maximum characters of a password to analyze
+MAX_LENGTH = 256
+
+# maximum edit distance of similar common words, larger distances are
+# capped, the cost of the search grows exponentially with the distance
+MAX_DISTANCE = 2
 
 
 def is_asdf(raw):
     """If the password is in the order on keyboard."""
 
-    reverse = raw[::-1]
-    asdf = ''.join(ASDF)
-
-    return raw in asdf or reverse in asdf
+    return raw in _ASDF or raw[::-1] in _ASDF
 
 
 def is_by_step(raw):
     """If the password is alphabet step by step."""
+    if len(raw) < 2:
+        return True
+
     # make sure it is unicode
     delta = ord(raw[1]) - ord(raw[0])
 
@@ -91,20 +421,52 @@ def is_by_step(raw):
     return True
 
 
-def is_common_password(raw, freq=0, cache_words=True):
+def is_common_password(raw, freq=0, cache_words=True, words=None):
     """If the password is common used.
 
     10k top passwords: https://xato.net/passwords/more-top-worst-passwords/
+
+    :param raw: raw text password.
+    :param freq: minimum frequency.
+    :param cache_words: cache the bundled words in a compiled file.
+    :param words: a word list backend instead of the bundled words, any
+                  object with a ``get(word, default)`` method, e.g.
+                  :class:`~safe.wordlist.BlockWords`.
     """
-    global WORDS
-    if not WORDS:
-        WORDS = _load_words(cache_words)
-    frequent = WORDS.get(raw, 0)
+    if words is None:
+        words = _wordlist.get(cache_words)
+    frequent = words.get(raw, 0)
     if freq:
         return frequent > freq
     return bool(frequent)
 
 
+def char_types(raw):
+    """The character families of the password as a bitmask of
+    ``TYPE_LOWER``, ``TYPE_UPPER``, ``TYPE_NUMBER`` and ``TYPE_MARKS``,
+    computed in a single pass::
+
+        >>> char_types(u'yhnolkuT.') == TYPE_LOWER | TYPE_UPPER | TYPE_MARKS
+        True
+    """
+    types = 0
+    for c in set(to_unicode(raw).translate(_FAMILIES)):
+        types |= _FAMILY_BITS.get(c, TYPE_MARKS)
+    return types
+
+
+def count_types(raw):
+    """Count characters of every family in the password, in a single
+    pass. It returns a tuple of ``(lower, upper, number, marks)``.
+    """
+    raw = to_unicode(raw)
+    counts = Counter(raw.translate(_FAMILIES))
+    lower = counts.pop(u'a', 0)
+    upper = counts.pop(u'A', 0)
+    number = counts.pop(u'0', 0)
+    return lower, upper, number, len(raw) - lower - upper - number
+
+
 class Strength(object):
     """Measure the strength of a password.
 
@@ -122,6 +484,8 @@ class Strength(object):
     :param strength: the strength level of the password
     :param message: a message related to the password
     """
+    __slots__ = ('valid', 'strength', 'message')
+
     def __init__(self, valid, strength, message):
         self.valid = valid
         self.strength = strength
@@ -143,51 +507,588 @@ class Strength(object):
         return self.valid
 
 
-def check(raw, length=8, freq=0, min_types=3, level=STRONG, cache_words=True):
+def _stage_pattern(policy, raw, words):
+    if is_asdf(raw) or is_by_step(raw):
+        return HAS_PATTERN
+
+
+def _stage_walk(policy, raw, words):
+    if walk_coverage(raw) >= policy.walk_ratio:
+        return HAS_PATTERN
+
+
+def _stage_common(policy, raw, words):
+    if is_common_password(raw, policy.freq, policy.cache_words, words):
+        return TOO_COMMON
+
+
+def _stage_similar(policy, raw, words):
+    if policy.distance:
+        trie = _trie.get(policy.cache_words)
+        for _, frequent, _ in trie.search(raw.lower(), policy.distance):
+            if frequent > policy.freq:
+                return TOO_COMMON
+
+
+def _stage_words(policy, raw, words):
+    if policy.word_ratio is not None and policy.word_ratio <= 1:
+        automaton = _automaton.get(policy.cache_words)
+        if automaton.coverage(raw, policy.leet) >= policy.word_ratio:
+            return TOO_COMMON
+
+
+def _stage_types(policy, raw, words):
+    return _types_code(policy, char_types(raw))
+
+
+def _types_code(policy, types):
+    types = _POPCOUNT[types]
+
+    if types < 2:
+        return TOO_SIMPLE
+
+    if types < policy.min_types:
+        return NOT_STRONG
+
+    return PERFECT
+
+
+def _stage_guesses(policy, raw, words):
+    from .scoring import estimate
+    automaton = _automaton.get(policy.cache_words)
+    guesses, _ = estimate(raw, automaton, policy.leet)
+    simple, medium, strong = GUESS_LEVELS
+    if guesses < simple:
+        return GUESS_TERRIBLE
+    if guesses < medium:
+        return GUESS_SIMPLE
+    if guesses < strong:
+        return GUESS_MEDIUM
+    return PERFECT
+
+
+# checking stages in order, the first stage returning a message code
+# decides the result, the last stage always returns one
+_STAGES = (
+    ('pattern', _stage_pattern),
+    ('walk', _stage_walk),
+    ('common', _stage_common),
+    ('similar', _stage_similar),
+    ('words', _stage_words),
+    ('types', _stage_types),
+)
+_GUESS_STAGES = (
+    ('common', _stage_common),
+    ('guesses', _stage_guesses),
+)
+
+
+def _evaluate(policy, raw, words):
+    """Run the checking pipeline of the policy on an unicode password,
+    and return the message code of the result.
+    """
+    if len(raw) < policy.length:
+        code = TOO_SHORT
+    elif len(raw) > policy.max_length and not policy.truncate:
+        code = TOO_LONG
+    else:
+        if len(raw) > policy.max_length:
+            raw = raw[:policy.max_length]
+        stages = _GUESS_STAGES if policy.guesses else _STAGES
+        if metrics.recorder is None:
+            for _, stage in stages:
+                code = stage(policy, raw, words)
+                if code is not None:
+                    return code
+        code = _evaluate_timed(policy, raw, words, stages)
+
+    if metrics.recorder is not None:
+        _record(code)
+    return code
+
+
+def _evaluate_many(policy, raws, words):
+    """Run the checking pipeline of the policy on a list of unicode
+    passwords, and return a list of message codes. The word list is
+    probed with all passwords at once, with ``get_many`` of the backend
+    if there is one, and the character families of all passwords are
+    classified by a single ``translate``. Other stages run per password
+    in the order of :data:`_STAGES`.
+    """
+    if policy.guesses or metrics.recorder is not None:
+        return [_evaluate(policy, raw, words) for raw in raws]
+
+    codes = [None] * len(raws)
+    indexes = []
+    texts = []
+    max_length = policy.max_length
+    for i, raw in enumerate(raws):
+        if len(raw) < policy.length:
+            codes[i] = TOO_SHORT
+        elif len(raw) > max_length and not policy.truncate:
+            codes[i] = TOO_LONG
+        else:
+            indexes.append(i)
+            texts.append(raw[:max_length])
+
+    get_many = getattr(words, 'get_many', None)
+    if get_many is not None:
+        frequents = get_many(texts, 0)
+    else:
+        frequents = list(map(words.get, texts, [0] * len(texts)))
+    families = u''.join(texts).translate(_FAMILIES)
+
+    freq = policy.freq
+    end = 0
+    for i, raw, frequent in zip(indexes, texts, frequents):
+        start = end
+        end += len(raw)
+        code = _stage_pattern(policy, raw, words)
+        if code is None:
+            code = _stage_walk(policy, raw, words)
+        if code is None and (frequent > freq if freq else frequent):
+            code = TOO_COMMON
+        if code is None:
+            code = _stage_similar(policy, raw, words)
+        if code is None:
+            code = _stage_words(policy, raw, words)
+        if code is None:
+            family = families[start:end]
+            types = 0
+            if u'a' in family:
+                types |= TYPE_LOWER
+            if u'A' in family:
+                types |= TYPE_UPPER
+            if u'0' in family:
+                types |= TYPE_NUMBER
+            count = (family.count(u'a') + family.count(u'A') +
+                     family.count(u'0'))
+            if count < len(family):
+                types |= TYPE_MARKS
+            code = _types_code(policy, types)
+        codes[i] = code
+    return codes
+
+
+def _evaluate_timed(policy, raw, words, stages):
+    timer = _timer
+    for name, stage in stages:
+        start = timer()
+        code = stage(policy, raw, words)
+        metrics.timing('stage.' + name, timer() - start)
+        if code is not None:
+            return code
+
+
+def _record(code):
+    metrics.incr('check.level.' + LEVELS[MESSAGES[code][0]])
+    metrics.incr('check.message.' + CODE_NAMES[code])
+
+
+def _is_valid(code, level):
+    strength, _, invalid = MESSAGES[code]
+    return not invalid and level <= strength
+
+
+def check(raw, length=8, freq=0, min_types=3, level=STRONG, cache_words=True,
+          words=None, walk_ratio=WALK_RATIO, word_ratio=None,
+          leet=True, guesses=False, max_length=MAX_LENGTH, truncate=True,
+          cache=None, distance=0):
     """Check the safety level of the password.
 
+    The cost of a check is bounded: passwords are analyzed up to
+    ``max_length`` characters, every analysis is linear in the length,
+    except that common words are matched in ``O(n * d)``, where ``d`` is
+    the length of the longest common word, and the guesses are
+    estimated in ``O(n * d)`` as well. The only work on the whole
+    password is converting it to unicode.
+
+    The search of similar words by ``distance`` is not linear, its cost
+    grows exponentially with the distance, it is about 0.3ms per
+    password for a distance of ``1`` and 3ms for ``2``. The distance is
+    capped at :data:`MAX_DISTANCE`.
+
     :param raw: raw text password.
     :param length: minimal length of the password.
     :param freq: minimum frequency.
     :param min_types: minimum character family.
     :param level: minimum level to validate a password.
+    :param cache_words: cache the bundled words in a compiled file.
+    :param words: a word list backend, see :meth:`is_common_password`.
+    :param walk_ratio: reject passwords when keyboard walks cover this
+                       ratio of characters, see
+                       :meth:`safe.keyboard.walk_coverage`.
+    :param word_ratio: reject passwords when embedded common words cover
+                       this ratio of characters, see
+                       :meth:`safe.dictionary.Automaton.coverage`, e.g.
+                       :data:`WORD_RATIO`. It is disabled by default,
+                       it costs about 20us per password.
+    :param leet: match common words with leet substitutions.
+    :param guesses: measure the strength by the estimated guesses to
+                    crack the password, instead of patterns and character
+                    families, see :meth:`safe.scoring.estimate`.
+    :param max_length: maximum characters of the password to analyze.
+    :param truncate: analyze only the first ``max_length`` characters of
+                     longer passwords, or reject them as too long.
+    :param cache: a :class:`VerdictCache` of repeated passwords.
+    :param distance: reject passwords within this edit distance of a
+                     bundled common word, e.g. ``passwrod``, see
+                     :meth:`safe.trie.Trie.search`. It is disabled by
+                     default, see the cost above.
     """
-    raw = to_unicode(raw)
-    if level > STRONG:
-        level = STRONG
+    policy = Policy(
+        length, freq, min_types, level, cache_words, words, walk_ratio,
+        word_ratio, leet, guesses, max_length, truncate, cache, distance,
+    )
+    code = policy.evaluate(raw)
+    strength, message, _ = MESSAGES[code]
+    return Strength(_is_valid(code, policy.level), LEVELS[strength], message)
 
-    if len(raw) < length:
-        return Strength(False, 'terrible', 'password is too short')
 
-    if is_asdf(raw) or is_by_step(raw):
-        return Strength(False, 'simple', 'password has a pattern')
+# maximum distinct passwords remembered by check_many
+_BATCH_MEMO_SIZE = 1 << 16
+# passwords read from the input of check_many at a time
+_BATCH_CHUNK_SIZE = 4096
 
-    if is_common_password(raw, freq=freq, cache_words=cache_words):
-        return Strength(False, 'simple', 'password is too common')
 
-    types = 0
+class Batch(object):
+    """The columnar result of :meth:`check_many`. Results are stored in
+    three parallel arrays, in the same order as the input passwords:
 
-    if LOWER.search(raw):
-        types += 1
+    - ``valid``: ``1`` if the password is valid to use, else ``0``
+    - ``levels``: the strength level, index of :data:`LEVELS`
+    - ``messages``: the message code, index of :data:`MESSAGES`
 
-    if UPPER.search(raw):
-        types += 1
+    A :class:`Strength` of any password can still be read from the batch::
 
-    if NUMBER.search(raw):
-        types += 1
+        >>> batch = check_many(['password', 'x*V-92Ba'])
+        >>> list(batch.valid)
+        [0, 1]
+        >>> repr(batch[1])
+        'strong'
+    """
+    def __init__(self, valid, levels, messages):
+        self.valid = valid
+        self.levels = levels
+        self.messages = messages
 
-    if MARKS.search(raw):
-        types += 1
+    def __len__(self):
+        return len(self.messages)
 
-    if types < 2:
-        return Strength(level <= SIMPLE, 'simple', 'password is too simple')
+    def __getitem__(self, index):
+        _, message, _ = MESSAGES[self.messages[index]]
+        return Strength(
+            bool(self.valid[index]), LEVELS[self.levels[index]], message
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def check_many(iterable, length=8, freq=0, min_types=3, level=STRONG,
+               cache_words=True, words=None, walk_ratio=WALK_RATIO,
+               word_ratio=None, leet=True, guesses=False,
+               max_length=MAX_LENGTH, truncate=True, cache=None,
+               distance=0):
+    """Check the safety level of many passwords at once. Parameters are
+    the same as :meth:`check`, the result is a :class:`Batch`.
+
+    The verdict of every message code is computed only once per batch,
+    and duplicated passwords in the batch are checked only once.
+    Passwords are read in chunks, the word list is probed with a whole
+    chunk at once, with ``get_many`` of the backend if there is one,
+    e.g. :meth:`safe.ranges.RangeWords.get_many`, and the character
+    families of a chunk are classified in a single pass.
+
+    :param iterable: an iterable of raw text passwords.
+    """
+    policy = Policy(
+        length, freq, min_types, level, cache_words, words, walk_ratio,
+        word_ratio, leet, guesses, max_length, truncate, cache, distance,
+    )
+    return policy.check_many(iterable)
+
+
+class VerdictCache(object):
+    """A bounded cache of verdicts of repeated passwords, in front of
+    :meth:`check` and :class:`Policy`::
+
+        >>> cache = VerdictCache(size=10000, ttl=3600)
+        >>> policy = Policy(cache=cache)
+        >>> policy('x*V-92Ba')
+        strong
+        >>> cache.stats()
+        {'size': 1, 'hits': 0, 'misses': 1, 'evictions': 0}
+
+    Passwords are not kept in memory, they are keyed by an HMAC with a
+    per-process secret. The least recently used verdicts are evicted
+    when the cache is full.
+
+    :param size: maximum number of verdicts.
+    :param ttl: seconds to keep a verdict, forever by default.
+    :param secret: key of the HMAC, a random secret by default.
+    """
+    def __init__(self, size=1024, ttl=None, secret=None):
+        self.size = size
+        self.ttl = ttl
+        self._secret = secret or os.urandom(32)
+        import hmac
+        import hashlib
+        self._hmac = hmac.new
+        self._hash = hashlib.sha256
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, policy_key, raw):
+        """The key of an unicode password checked by a policy."""
+        digest = self._hmac(
+            self._secret, raw.encode('utf-8', 'surrogatepass'), self._hash,
+        ).digest()
+        return policy_key, digest
+
+    def get(self, key):
+        """The cached message code, or ``None``."""
+        code = None
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                if item[1] is None or item[1] > _timer():
+                    # move it to the end as the most recently used
+                    self._items[key] = item
+                    code = item[0]
+                else:
+                    self.evictions += 1
+            if code is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if metrics.recorder is not None:
+            metrics.incr('verdicts.miss' if code is None else 'verdicts.hit')
+        return code
+
+    def set(self, key, code):
+        expires = None
+        if self.ttl is not None:
+            expires = _timer() + self.ttl
+        with self._lock:
+            items = self._items
+            items.pop(key, None)
+            items[key] = (code, expires)
+            while len(items) > self.size:
+                items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        """Counters of the cache, to size it."""
+        return {
+            'size': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def __len__(self):
+        return len(self._items)
+
+
+class _Identity(object):
+    """A hashable key of an object by its identity. The key keeps the
+    object alive, so its id is not reused by another object while the
+    key is in a cache.
+    """
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, _Identity) and other.obj is self.obj
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class Verdict(Strength):
+    """An immutable :class:`Strength`, which is shared by all passwords
+    with the same result of a :class:`Policy`.
+    """
+    __slots__ = ()
+
+    def __init__(self, valid, strength, message):
+        Strength.__setattr__(self, 'valid', valid)
+        Strength.__setattr__(self, 'strength', strength)
+        Strength.__setattr__(self, 'message', message)
 
-    if types < min_types:
-        return Strength(level <= MEDIUM, 'medium',
-                        'password is good enough, but not strong')
+    def __setattr__(self, name, value):
+        raise AttributeError('Verdict is immutable')
 
-    return Strength(True, 'strong', 'password is perfect')
+    def __delattr__(self, name):
+        raise AttributeError('Verdict is immutable')
+
+    def __reduce__(self):
+        return Verdict, (self.valid, self.strength, self.message)
+
+
+class Policy(object):
+    """A compiled checking policy. Parameters are the same as
+    :meth:`check`, but they are handled only once, which is faster for
+    services checking every password with the same policy::
+
+        >>> policy = Policy(length=10, level=MEDIUM)
+        >>> policy('x*V-92Ba')
+        terrible
+
+    Calling the policy returns a shared :class:`Verdict` per result
+    instead of a new :class:`Strength`.
+    """
+    def __init__(self, length=8, freq=0, min_types=3, level=STRONG,
+                 cache_words=True, words=None, walk_ratio=WALK_RATIO,
+                 word_ratio=None, leet=True, guesses=False,
+                 max_length=MAX_LENGTH, truncate=True, cache=None,
+                 distance=0):
+        if level > STRONG:
+            level = STRONG
+        if distance > MAX_DISTANCE:
+            distance = MAX_DISTANCE
+        self.length = length
+        self.freq = freq
+        self.min_types = min_types
+        self.level = level
+        self.cache_words = cache_words
+        self.words = words
+        self.walk_ratio = walk_ratio
+        self.word_ratio = word_ratio
+        self.leet = leet
+        self.guesses = guesses
+        self.max_length = max_length
+        self.truncate = truncate
+        self.cache = cache
+        self.distance = distance
+        self._verdicts = None
+        # verdicts of policies with the same parameters share a cache,
+        # a word list backend is identified by the object
+        self._cache_key = (
+            length, freq, min_types, cache_words, _Identity(words),
+            walk_ratio, word_ratio, leet, guesses, max_length, truncate,
+            distance,
+        )
+
+    @property
+    def verdicts(self):
+        """The shared verdict of every message code."""
+        if self._verdicts is None:
+            level = self.level
+            self._verdicts = tuple(
+                Verdict(_is_valid(code, level), LEVELS[strength], message)
+                for code, (strength, message, _) in enumerate(MESSAGES)
+            )
+        return self._verdicts
+
+    def _get_words(self):
+        if self.words is not None:
+            return self.words
+        return _wordlist.get(self.cache_words)
+
+    def _evaluate_cached(self, raw, words):
+        cache = self.cache
+        key = cache.key((self._cache_key, _wordlist.generation), raw)
+        code = cache.get(key)
+        if code is None:
+            code = _evaluate(self, raw, words)
+            cache.set(key, code)
+        return code
+
+    def evaluate(self, raw):
+        """Check the password, and return its message code."""
+        if self.cache is not None:
+            return self._evaluate_cached(to_unicode(raw), self._get_words())
+        return _evaluate(self, to_unicode(raw), self._get_words())
+
+    def __call__(self, raw):
+        return self.verdicts[self.evaluate(raw)]
+
+    def check_many(self, iterable):
+        """Check many passwords at once, see :meth:`safe.check_many`."""
+        # verdict columns of every message code
+        valid_of = [int(v.valid) for v in self.verdicts]
+        level_of = [strength for strength, _, _ in MESSAGES]
+
+        valid = array('b')
+        levels = array('b')
+        messages = array('b')
+
+        seen = {}
+        words = self._get_words()
+        iterator = iter(iterable)
+        while True:
+            chunk = [
+                to_unicode(raw)
+                for raw in itertools.islice(iterator, _BATCH_CHUNK_SIZE)
+            ]
+            if not chunk:
+                break
+            if len(seen) >= _BATCH_MEMO_SIZE:
+                seen.clear()
+            # distinct passwords of the chunk which are not checked yet
+            fresh = list(OrderedDict.fromkeys(
+                raw for raw in chunk if raw not in seen
+            ))
+            if self.cache is None:
+                codes = _evaluate_many(self, fresh, words)
+            else:
+                codes = [
+                    self._evaluate_cached(raw, words) for raw in fresh
+                ]
+            seen.update(zip(fresh, codes))
+            messages.extend(seen[raw] for raw in chunk)
+
+        for code in messages:
+            valid.append(valid_of[code])
+            levels.append(level_of[code])
+        return Batch(valid, levels, messages)
 
 
 def safety(raw, length=8, freq=0, min_types=2, level=STRONG):
     return check(raw, length=8, freq=0, min_types=2, level=STRONG)
+
+
+from .incremental import IncrementalChecker
+
+_AIO = ('apreload', 'acheck', 'acheck_many')
+
+
+def __getattr__(name):
+    """Load the regexes and the asyncio helpers on first access."""
+    if name in _PATTERNS:
+        import re
+        value = globals()[name] = re.compile(_PATTERNS[name])
+        return value
+    if sys.version_info >= (3, 5) and (name == 'aio' or name in _AIO):
+        import importlib
+        module = importlib.import_module('.aio', __name__)
+        return module if name == 'aio' else getattr(module, name)
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name)
+    )
+
+
+if sys.version_info >= (3, 5):
+    __all__ += list(_AIO)
+
+if sys.version_info < (3, 7):
+    # module __getattr__ is not supported, load everything now
+    for _name in _PATTERNS:
+        globals()[_name] = __getattr__(_name)
+    if sys.version_info >= (3, 5):
+        from .aio import apreload, acheck, acheck_many
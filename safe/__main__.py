@@ -0,0 +1,182 @@
+# coding: utf-8
+"""
+    safe.__main__
+
+    Check passwords from the command line, one password per line::
+
+        $ python -m safe passwords.txt.gz --format csv > verdicts.csv
+        $ zcat dump.gz | safe-audit --length 10 -w 8
+
+    Input and output are streamed, memory is constant no matter how
+    large the input is. A histogram of strength levels is written into
+    stderr at the end.
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import io
+import sys
+import json
+import argparse
+from . import LEVELS, MESSAGES, STRONG
+from .audit import audit
+
+_BUFFER_SIZE = 1 << 20
+
+# magic bytes of compressed files
+_COMPRESSIONS = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'lzma'),
+)
+
+
+def _open(filename):
+    """Open an input file in binary mode, compressed files are detected
+    by their magic bytes. It returns the stream to read and the file to
+    close.
+    """
+    if filename == '-':
+        f = io.open(
+            sys.stdin.fileno(), 'rb', buffering=_BUFFER_SIZE, closefd=False
+        )
+    else:
+        f = io.open(filename, 'rb', buffering=_BUFFER_SIZE)
+
+    head = f.peek(8)[:8]
+    for magic, name in _COMPRESSIONS:
+        if head.startswith(magic):
+            return __import__(name).open(f), f
+    return f, f
+
+
+def _read_lines(filenames):
+    for filename in filenames:
+        stream, f = _open(filename)
+        try:
+            for line in stream:
+                yield line.rstrip(b'\r\n').decode('utf-8', 'replace')
+        finally:
+            stream.close()
+            f.close()
+
+
+def _format_jsonl(index, valid, strength, message):
+    return json.dumps({
+        'index': index, 'valid': bool(valid),
+        'strength': strength, 'message': message,
+    }) + '\n'
+
+
+def _format_csv(index, valid, strength, message):
+    # messages contain commas, they are quoted as RFC 4180
+    return '%d,%d,%s,"%s"\n' % (
+        index, valid, strength, message.replace('"', '""')
+    )
+
+
+def _format_tsv(index, valid, strength, message):
+    return '%d\t%d\t%s\t%s\n' % (index, valid, strength, message)
+
+
+_FORMATS = {
+    'jsonl': (_format_jsonl, None),
+    'csv': (_format_csv, 'index,valid,strength,message\n'),
+    'tsv': (_format_tsv, None),
+}
+
+
+def _level(value):
+    if value in LEVELS:
+        return LEVELS.index(value)
+    return int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='safe-audit',
+        description='Check the safety of passwords, one per line.',
+    )
+    parser.add_argument(
+        'files', nargs='*', default=['-'], metavar='FILE',
+        help='password files, may be gzip, bz2 or xz compressed, '
+             'defaults to stdin',
+    )
+    parser.add_argument(
+        '-o', '--output', default='-',
+        help='write verdicts into this file, defaults to stdout',
+    )
+    parser.add_argument(
+        '-f', '--format', choices=sorted(_FORMATS), default='jsonl',
+        help='format of verdicts, defaults to jsonl',
+    )
+    parser.add_argument(
+        '--length', type=int, default=8,
+        help='minimal length of the password',
+    )
+    parser.add_argument(
+        '--freq', type=int, default=0,
+        help='minimum frequency of common passwords',
+    )
+    parser.add_argument(
+        '--min-types', type=int, default=3,
+        help='minimum character family',
+    )
+    parser.add_argument(
+        '--level', type=_level, default=STRONG,
+        help='minimum level to validate a password, one of %s' % (
+            ', '.join(LEVELS)
+        ),
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=None,
+        help='number of processes, defaults to the number of cores',
+    )
+    parser.add_argument(
+        '--chunk-size', type=int, default=10000,
+        help='number of passwords in a chunk',
+    )
+    args = parser.parse_args(argv)
+
+    if args.output == '-':
+        sys.stdout.flush()
+        out = io.open(
+            sys.stdout.fileno(), 'wb', buffering=_BUFFER_SIZE, closefd=False
+        )
+    else:
+        out = io.open(args.output, 'wb', buffering=_BUFFER_SIZE)
+
+    formatter, header = _FORMATS[args.format]
+    if header:
+        out.write(header.encode('utf-8'))
+
+    histogram = [0] * len(LEVELS)
+    results = audit(
+        _read_lines(args.files),
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        length=args.length,
+        freq=args.freq,
+        min_types=args.min_types,
+        level=args.level,
+    )
+    try:
+        for offset, batch in results:
+            lines = []
+            for i in range(len(batch)):
+                level = batch.levels[i]
+                histogram[level] += 1
+                lines.append(formatter(
+                    offset + i, batch.valid[i], LEVELS[level],
+                    MESSAGES[batch.messages[i]][1],
+                ))
+            out.write(''.join(lines).encode('utf-8'))
+    finally:
+        out.close()
+
+    for name, count in zip(LEVELS, histogram):
+        sys.stderr.write('%s\t%d\n' % (name, count))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,20 +9,18 @@
 
 
 import sys
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
 
 if sys.version_info[0] == 3:
     unicode_type = str
     bytes_type = bytes
+    unichr = chr
 else:
     unicode_type = unicode
     bytes_type = str
+    unichr = unichr
 
 
-__all__ = ['pickle', 'to_unicode']
+__all__ = ['to_unicode']
 
 
 def to_unicode(value, encoding='utf-8'):
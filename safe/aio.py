@@ -0,0 +1,106 @@
+# coding: utf-8
+"""
+    safe.aio
+
+    Checking passwords in asyncio applications without blocking the
+    event loop. The bundled words are loaded in a thread, and concurrent
+    first calls share the same load::
+
+        strength = await safe.acheck('x*V-92Ba')
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import sys
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import (
+    STRONG, _wordlist, _automaton, _trie, preload, check, check_many,
+)
+
+__all__ = ['apreload', 'acheck', 'acheck_many']
+
+_lock = threading.Lock()
+_loading = None
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                options = {'max_workers': 4}
+                if sys.version_info >= (3, 6):
+                    options['thread_name_prefix'] = 'safe'
+                _executor = ThreadPoolExecutor(**options)
+    return _executor
+
+
+async def apreload(cache_words=True):
+    """An awaitable :meth:`safe.preload`. Only one load is running at a
+    time, no matter how many coroutines and event loops are waiting
+    for it.
+    """
+    global _loading
+    if _wordlist.value is not None and _automaton.value is not None:
+        return preload(cache_words)
+
+    executor = _get_executor()
+    with _lock:
+        if _loading is None or (_loading.done() and _loading.exception()):
+            _loading = executor.submit(preload, cache_words)
+        loading = _loading
+    return await asyncio.wrap_future(loading)
+
+
+async def _run(executor, func, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    if executor is None:
+        executor = _get_executor()
+    return await loop.run_in_executor(
+        executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+async def acheck(raw, length=8, freq=0, min_types=3, level=STRONG,
+                 cache_words=True, words=None, executor=None, **options):
+    """An awaitable :meth:`safe.check`. With the bundled words, checking
+    runs in the event loop after the words are loaded. With a custom
+    word list backend, which may read from disk, checking runs in the
+    ``executor``. Other parameters are the same as :meth:`safe.check`.
+
+    :param executor: an executor for blocking calls, a shared thread
+                     pool by default.
+    """
+    if words is None:
+        await apreload(cache_words)
+        # the trie of similar words is loaded on first use
+        if not options.get('distance') or _trie.value is not None:
+            return check(
+                raw, length, freq, min_types, level, cache_words,
+                **options
+            )
+    return await _run(
+        executor, check, raw, length, freq, min_types, level,
+        cache_words, words, **options
+    )
+
+
+async def acheck_many(iterable, length=8, freq=0, min_types=3,
+                      level=STRONG, cache_words=True, words=None,
+                      executor=None, **options):
+    """An awaitable :meth:`safe.check_many`, the batch is checked in the
+    ``executor``. Other parameters are the same as :meth:`safe.check`.
+
+    :param executor: an executor for blocking calls, a shared thread
+                     pool by default.
+    """
+    if words is None:
+        await apreload(cache_words)
+    return await _run(
+        executor, check_many, list(iterable), length, freq, min_types,
+        level, cache_words, words, **options
+    )
@@ -0,0 +1,108 @@
+# coding: utf-8
+"""
+    safe.audit
+
+    Checking huge amounts of passwords on all cores. Passwords are
+    split into chunks, which are checked by :meth:`safe.check_many` in a
+    pool of processes::
+
+        for offset, batch in audit(passwords, workers=8):
+            for i, strength in enumerate(batch):
+                print(offset + i, repr(strength))
+
+    The bundled words are compiled into the cache file before the pool
+    starts, every worker maps the same file, so the words are shared
+    through the OS page cache instead of being loaded by every worker.
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import itertools
+import multiprocessing
+from collections import deque
+from . import STRONG, preload, check_many
+
+__all__ = ['audit']
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _init_worker(cache_words):
+    preload(cache_words)
+
+
+def _check_chunk(args):
+    chunk, options = args
+    return check_many(chunk, **options)
+
+
+def audit(iterable, workers=None, chunk_size=10000, length=8, freq=0,
+          min_types=3, level=STRONG, cache_words=True, words=None,
+          **options):
+    """Check passwords in parallel. It yields ``(offset, batch)`` in the
+    order of the input, where ``batch`` is the :class:`~safe.Batch` of
+    the passwords starting from index ``offset``.
+
+    At most two chunks per worker are in flight, memory is bounded no
+    matter how large the input is.
+
+    :param iterable: an iterable of raw text passwords.
+    :param workers: number of processes, defaults to the number of
+                    cores, checking is done in the current process when
+                    it is ``1``.
+    :param chunk_size: number of passwords in a chunk.
+    :param words: a word list backend, it must be picklable to be sent
+                  to the workers.
+
+    Other parameters are the same as :meth:`safe.check`. A verdict
+    ``cache`` is used only when ``workers`` is ``1``, it can not be
+    shared by worker processes.
+    """
+    options.update(
+        length=length, freq=freq, min_types=min_types, level=level,
+        cache_words=cache_words, words=words,
+    )
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    offset = 0
+    if workers <= 1:
+        for chunk in _chunks(iterable, chunk_size):
+            yield offset, check_many(chunk, **options)
+            offset += len(chunk)
+        return
+
+    options.pop('cache', None)
+    if words is None:
+        # compile the cache file before forking, so workers map it
+        preload(cache_words)
+
+    pool = multiprocessing.Pool(
+        workers, initializer=_init_worker, initargs=(cache_words,)
+    )
+    try:
+        pending = deque()
+        for chunk in _chunks(iterable, chunk_size):
+            pending.append((len(chunk), pool.apply_async(
+                _check_chunk, ((chunk, options),)
+            )))
+            if len(pending) >= workers * 2:
+                size, result = pending.popleft()
+                yield offset, result.get()
+                offset += size
+
+        while pending:
+            size, result = pending.popleft()
+            yield offset, result.get()
+            offset += size
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,160 @@
+# coding: utf-8
+"""
+    safe.cache
+
+    Cache files of the compiled words and the automaton. A cache file is
+    the compiled data followed by a key of its source::
+
+        data    the compiled words, or the saved automaton
+        magic   8 bytes, b'SAFEKEY\\x01'
+        key     20 bytes, sha1 of the version, the format, the path,
+                the size and the modified time of the source
+
+    A cache file of another source or another version is rebuilt. Cache
+    files are written into a temporary file and renamed, and they are
+    built under a file lock, so only one process on a host builds them
+    while the others wait and map the result.
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import os
+import mmap
+import hashlib
+import contextlib
+from . import metrics, log
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+__all__ = ['source_key', 'load']
+
+MAGIC = b'SAFEKEY\x01'
+_TRAILER_SIZE = len(MAGIC) + 20
+
+
+def source_key(filepath, *extra):
+    """The key of a source file, it changes when the file is replaced or
+    modified.
+
+    :param filepath: path of the source file.
+    :param extra: other values of the key, e.g. the version.
+    """
+    stat = os.stat(filepath)
+    mtime = getattr(stat, 'st_mtime_ns', None) or int(stat.st_mtime * 1e9)
+    parts = [os.path.abspath(filepath), str(stat.st_size), str(mtime)]
+    parts.extend(str(v) for v in extra)
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).digest()
+
+
+def _read(filename, key, parse):
+    """Map the cache file, and parse it when the key matches. It returns
+    ``(value, state)``, state is one of ``hit``, ``miss``, ``stale`` and
+    ``corrupt``.
+    """
+    try:
+        f = open(filename, 'rb')
+    except (IOError, OSError):
+        return None, 'miss'
+    with f:
+        stat = os.fstat(f.fileno())
+        if hasattr(os, 'getuid') and stat.st_uid != os.getuid():
+            # never trust files of other users in a shared directory
+            log.warning('Cache file %s is not owned by us' % filename)
+            return None, 'corrupt'
+        if stat.st_size < _TRAILER_SIZE:
+            return None, 'corrupt'
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    trailer = buf[-_TRAILER_SIZE:]
+    if trailer[:len(MAGIC)] != MAGIC:
+        return None, 'corrupt'
+    if trailer[len(MAGIC):] != key:
+        return None, 'stale'
+    try:
+        return parse(buf), 'hit'
+    except ValueError:
+        return None, 'corrupt'
+
+
+@contextlib.contextmanager
+def _locked(filename):
+    if fcntl is None:  # pragma: no cover
+        yield
+        return
+    with open(filename + '.lock', 'ab') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _write(filename, key, dump):
+    import tempfile
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(prefix='.' + basename, dir=dirname)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            dump(f)
+            f.write(MAGIC + key)
+            f.flush()
+            os.fsync(f.fileno())
+        if hasattr(os, 'replace'):
+            os.replace(tmp, filename)
+        else:  # pragma: no cover
+            os.rename(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load(name, filename, key, parse, build):
+    """Load a value from the cache file, or build and cache it.
+
+    :param name: name of the value in metrics and logs.
+    :param filename: path of the cache file.
+    :param key: the key of the source, see :meth:`source_key`.
+    :param parse: parse the value from a buffer of the cache file.
+    :param build: build the value, it returns ``(value, dump)``, where
+                  ``dump`` writes the value into a file object.
+
+    The built value is used in memory when the cache file can not be
+    locked or written.
+    """
+    value, state = _read(filename, key, parse)
+    metrics.incr('cache.%s.%s' % (name, state))
+    if value is not None:
+        log.debug('Read %s from cache file %s' % (name, filename))
+        return value
+    if state != 'miss':
+        log.warning('Rebuild %s cache file %s, it is %s' % (
+            name, filename, state
+        ))
+
+    value = None
+    try:
+        with _locked(filename):
+            # another process may have built it while we were waiting
+            value, state = _read(filename, key, parse)
+            if value is not None:
+                return value
+            value, dump = build()
+            log.debug('Dump %s to cache file %s' % (name, filename))
+            _write(filename, key, dump)
+    except (IOError, OSError) as e:
+        # e.g. a read only directory, or a file of another user
+        log.warning('Can not write %s cache file %s: %s' % (
+            name, filename, e
+        ))
+        metrics.incr('cache.%s.error' % name)
+        if value is None:
+            value, _ = build()
+        return value
+    value, state = _read(filename, key, parse)
+    if value is None:
+        raise ValueError('Invalid cache file %s' % filename)
+    return value
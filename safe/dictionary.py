@@ -0,0 +1,263 @@
+# coding: utf-8
+"""
+    safe.dictionary
+
+    Find common words embedded in a password, e.g. ``monkeydragon`` and
+    ``P@ssw0rd2024!``. Words are matched by an Aho-Corasick automaton
+    built from the word list, all words in a password are found in a
+    single pass.
+
+    The automaton is stored in flat uint32 arrays, it is saved into a
+    single file and mapped into memory when loaded::
+
+        magic   8 bytes, b'SAFEAC\\x00\\x01'
+        states  number of states, S
+        edges   number of edges, E
+        first   S + 1 indexes of the first edge of every state
+        labels  E code points of edges, sorted in every state
+        targets E target states of edges
+        fail    S failure links
+        output  S nearest states with a word in the failure chain
+        freqs   S frequencies of words ending at every state
+        depths  S depths of every state
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import mmap
+import struct
+from bisect import bisect_left
+from array import array
+from collections import deque
+from ._compat import to_unicode
+from .wordlist import _uint_array
+
+__all__ = ['Automaton', 'LEET']
+
+MAGIC = b'SAFEAC\x00\x01'
+_HEADER = struct.Struct('<8sII')
+
+#: common leet substitutions, they are matched as the letters
+LEET = {
+    u'4': u'a', u'@': u'a', u'8': u'b', u'(': u'c', u'3': u'e',
+    u'6': u'g', u'9': u'g', u'1': u'i', u'!': u'i', u'|': u'l',
+    u'0': u'o', u'$': u's', u'5': u's', u'7': u't', u'+': u't',
+    u'2': u'z',
+}
+
+_LOWER = dict(
+    (ord(c), c.lower()) for c in u'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+)
+_LOWER_LEET = dict(_LOWER)
+_LOWER_LEET.update((ord(c), v) for c, v in LEET.items())
+
+
+class Automaton(object):
+    """An Aho-Corasick automaton of words, all arrays are uint32 buffers.
+    Build it with :meth:`build` or load it with :meth:`load`.
+    """
+    def __init__(self, first, labels, targets, fail, output, freqs, depths):
+        self.first = first
+        self.labels = labels
+        self.targets = targets
+        self.fail = fail
+        self.output = output
+        self.freqs = freqs
+        self.depths = depths
+        # transitions of the root state are visited the most
+        root = {}
+        for i in range(first[0], first[1]):
+            root[labels[i]] = targets[i]
+        self._root = root
+
+    @classmethod
+    def build(cls, words):
+        """Build the automaton from a mapping of ``word -> freq``, words
+        are matched case insensitively.
+        """
+        # a trie of dicts, which is flattened in breadth first order
+        children = [{}]
+        freqs = [0]
+        depths = [0]
+        for word, freq in words.items():
+            state = 0
+            for c in to_unicode(word).translate(_LOWER):
+                nxt = children[state].get(ord(c))
+                if nxt is None:
+                    nxt = len(children)
+                    children[state][ord(c)] = nxt
+                    children.append({})
+                    freqs.append(0)
+                    depths.append(depths[state] + 1)
+                state = nxt
+            freqs[state] = max(freqs[state], freq or 1)
+
+        order = []
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for c in sorted(children[state]):
+                queue.append(children[state][c])
+        renumber = [0] * len(order)
+        for new, old in enumerate(order):
+            renumber[old] = new
+
+        size = len(order)
+        first = array('I', [0]) * (size + 1)
+        labels = array('I')
+        targets = array('I')
+        fail = array('I', [0]) * size
+        output = array('I', [0]) * size
+        for new, old in enumerate(order):
+            first[new] = len(labels)
+            for c in sorted(children[old]):
+                labels.append(c)
+                targets.append(renumber[children[old][c]])
+        first[size] = len(labels)
+
+        new_freqs = array('I', [0]) * size
+        new_depths = array('I', [0]) * size
+        for old in range(size):
+            new_freqs[renumber[old]] = freqs[old]
+            new_depths[renumber[old]] = depths[old]
+
+        automaton = cls(
+            first, labels, targets, fail, output, new_freqs, new_depths
+        )
+        # failure links in breadth first order, parents are done first
+        for state in range(size):
+            for i in range(first[state], first[state + 1]):
+                child = targets[i]
+                if state == 0:
+                    link = 0
+                else:
+                    link = automaton._step(fail[state], labels[i])
+                fail[child] = link
+                output[child] = link if new_freqs[link] else output[link]
+        return automaton
+
+    @classmethod
+    def load(cls, filename):
+        """Map a saved automaton into memory."""
+        with open(filename, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_buffer(buf)
+
+    @classmethod
+    def from_buffer(cls, buf):
+        """Read a saved automaton in place from a buffer, e.g. a mmap."""
+        if len(buf) < _HEADER.size:
+            raise ValueError('Invalid automaton')
+        magic, states, edges = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError('Invalid automaton')
+        if len(buf) < _HEADER.size + (states * 5 + 1 + edges * 2) * 4:
+            raise ValueError('Truncated automaton')
+        offset = _HEADER.size
+        arrays = []
+        for count in (states + 1, edges, edges, states, states, states,
+                      states):
+            arrays.append(_uint_array(buf, offset, count))
+            offset += count * 4
+        return cls(*arrays)
+
+    def save(self, fileobj):
+        """Write the automaton into a file object in binary mode."""
+        states = len(self.fail)
+        edges = len(self.labels)
+        fileobj.write(_HEADER.pack(MAGIC, states, edges))
+        for values in (self.first, self.labels, self.targets, self.fail,
+                       self.output, self.freqs, self.depths):
+            fileobj.write(struct.pack('<%dI' % len(values), *values))
+
+    def _step(self, state, c):
+        first = self.first
+        labels = self.labels
+        while state:
+            lo = first[state]
+            hi = first[state + 1]
+            if lo < hi:
+                i = bisect_left(labels, c, lo, hi)
+                if i < hi and labels[i] == c:
+                    return self.targets[i]
+            state = self.fail[state]
+        return self._root.get(c, 0)
+
+    def _scan(self, text, found):
+        state = 0
+        first = self.first
+        labels = self.labels
+        targets = self.targets
+        fail = self.fail
+        freqs = self.freqs
+        depths = self.depths
+        output = self.output
+        root = self._root
+        for end, c in enumerate(map(ord, text), 1):
+            # inlined _step, it is the hot loop, most states have a
+            # single edge, which is compared without bisecting
+            while state:
+                lo = first[state]
+                hi = first[state + 1]
+                if hi - lo == 1:
+                    if labels[lo] == c:
+                        state = targets[lo]
+                        break
+                elif lo < hi:
+                    i = bisect_left(labels, c, lo, hi)
+                    if i < hi and labels[i] == c:
+                        state = targets[i]
+                        break
+                state = fail[state]
+            else:
+                state = root.get(c, 0)
+            match = state if freqs[state] else output[state]
+            while match:
+                found.add((end - depths[match], end, freqs[match]))
+                match = output[match]
+
+    def ranks(self):
+        """Sorted frequencies of all words, the rank of a word is the
+        number of words with a higher frequency plus one.
+        """
+        ranks = getattr(self, '_ranks', None)
+        if ranks is None:
+            ranks = self._ranks = sorted(f for f in self.freqs if f)
+        return ranks
+
+    def find(self, raw, leet=True):
+        """Find all words in the password, case insensitively. It returns
+        a set of ``(start, end, freq)``.
+
+        :param raw: raw text password.
+        :param leet: also match leet substitutions, see :data:`LEET`.
+        """
+        raw = to_unicode(raw)
+        lower = raw.translate(_LOWER)
+        found = set()
+        self._scan(lower, found)
+        if leet:
+            normal = raw.translate(_LOWER_LEET)
+            if normal != lower:
+                self._scan(normal, found)
+        return found
+
+    def coverage(self, raw, leet=True):
+        """The fraction of characters of the password which are covered
+        by words, from ``0.0`` to ``1.0``.
+        """
+        raw = to_unicode(raw)
+        found = self.find(raw, leet)
+        if not found:
+            return 0.0
+        covered = 0
+        end = 0
+        for start, stop, _ in sorted(found):
+            if stop > end:
+                covered += stop - max(start, end)
+                end = stop
+        return covered / float(len(raw))
+
+    def __len__(self):
+        return len(self.fail)
@@ -0,0 +1,262 @@
+# coding: utf-8
+"""
+    safe.incremental
+
+    Checking a password while it is typed, e.g. for a live strength
+    meter. The state of every check is kept per character, an edit at
+    the end of the password updates the state in constant time instead
+    of checking the whole password again::
+
+        >>> checker = IncrementalChecker()
+        >>> checker.append('passw')
+        terrible
+        >>> checker.append('ord')
+        simple
+        >>> checker.delete(3)
+        terrible
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+from ._compat import to_unicode
+from .keyboard import _load as _load_keyboards, _EMPTY
+from .dictionary import _LOWER, _LOWER_LEET
+from . import (
+    Policy, _evaluate, _stage_similar, _automaton, _ASDF, _FAMILIES,
+    _FAMILY_BITS, _POPCOUNT, TYPE_MARKS, TOO_SHORT, TOO_LONG, HAS_PATTERN,
+    TOO_COMMON, TOO_SIMPLE, NOT_STRONG, PERFECT, is_common_password,
+)
+
+__all__ = ['IncrementalChecker']
+
+# walks are runs of at least 4 characters, as safe.keyboard.walk_coverage
+_WALK_RUN = 4
+_ALL_ENDS = tuple(range(len(_ASDF) + 1))
+
+
+class _State(object):
+    """The state of checks after a character."""
+    __slots__ = (
+        'char', 'types', 'step', 'forward', 'backward', 'mask',
+        'walk_covered', 'walk_end', 'lower', 'leet', 'marked',
+    )
+
+
+class IncrementalChecker(object):
+    """Check a password which is edited at the end. Parameters are the
+    same as :meth:`safe.check`, or a :class:`~safe.Policy`. Every edit
+    returns the shared :class:`~safe.Verdict` of the current password.
+
+    Patterns, keyboard walks, character families and embedded common
+    words are updated per character, the only work on the whole
+    password is the lookup of the exact password in the word list.
+    Passwords checked by the estimated guesses are checked again on
+    every edit.
+
+    :param policy: a :class:`~safe.Policy`, built from the other
+                   parameters by default.
+    """
+    def __init__(self, policy=None, **options):
+        if policy is None:
+            policy = Policy(**options)
+        self.policy = policy
+        self._chars = []
+        self._states = []
+        self._covered = []
+        self._word_count = 0
+        self._walk = policy.walk_ratio <= 1
+        self._words = (
+            policy.word_ratio is not None and policy.word_ratio <= 1 and
+            not policy.guesses
+        )
+        self._automaton = None
+        self._adjacency = _load_keyboards()[1]
+
+    @property
+    def text(self):
+        """The current password."""
+        return u''.join(self._chars)
+
+    def __len__(self):
+        return len(self._chars)
+
+    def append(self, chars):
+        """Append characters to the password."""
+        max_length = self.policy.max_length
+        for c in to_unicode(chars):
+            self._chars.append(c)
+            if len(self._states) < max_length:
+                self._push(c)
+        return self.verdict()
+
+    def delete(self, count=1):
+        """Delete characters from the end of the password."""
+        count = min(count, len(self._chars))
+        for _ in range(count):
+            self._chars.pop()
+            if len(self._states) > len(self._chars):
+                self._pop()
+        return self.verdict()
+
+    def update(self, text):
+        """Replace the password, only the characters after the common
+        prefix of the old and the new password are checked again.
+        """
+        text = to_unicode(text)
+        chars = self._chars
+        prefix = 0
+        size = min(len(chars), len(text))
+        while prefix < size and chars[prefix] == text[prefix]:
+            prefix += 1
+        if prefix < len(chars):
+            self.delete(len(chars) - prefix)
+        return self.append(text[prefix:])
+
+    def clear(self):
+        self.delete(len(self._chars))
+
+    def evaluate(self):
+        """The message code of the current password."""
+        policy = self.policy
+        n = len(self._chars)
+        if n < policy.length:
+            return TOO_SHORT
+        if n > policy.max_length and not policy.truncate:
+            return TOO_LONG
+
+        text = u''.join(self._chars[:policy.max_length])
+        if policy.guesses:
+            return _evaluate(policy, text, policy._get_words())
+
+        state = self._states[-1] if self._states else None
+        if state is None or state.step or state.forward or state.backward:
+            return HAS_PATTERN
+
+        size = len(self._states)
+        if size >= _WALK_RUN:
+            walk = state.walk_covered / float(size)
+        else:
+            walk = 0.0
+        if walk >= policy.walk_ratio:
+            return HAS_PATTERN
+
+        words = policy._get_words()
+        if is_common_password(text, policy.freq, policy.cache_words, words):
+            return TOO_COMMON
+        if _stage_similar(policy, text, words) is not None:
+            return TOO_COMMON
+
+        if self._words:
+            if self._word_count / float(size) >= policy.word_ratio:
+                return TOO_COMMON
+
+        types = _POPCOUNT[state.types]
+        if types < 2:
+            return TOO_SIMPLE
+        if types < policy.min_types:
+            return NOT_STRONG
+        return PERFECT
+
+    def verdict(self):
+        """The :class:`~safe.Verdict` of the current password."""
+        return self.policy.verdicts[self.evaluate()]
+
+    def _push(self, c):
+        states = self._states
+        prev = states[-1] if states else None
+        n = len(states) + 1
+
+        state = _State()
+        state.char = c
+        bit = _FAMILY_BITS.get(c.translate(_FAMILIES), TYPE_MARKS)
+
+        if prev is None:
+            state.types = bit
+            state.step = True
+            forward = backward = _ALL_ENDS
+            state.mask = 0
+            state.walk_covered = state.walk_end = 0
+        else:
+            state.types = prev.types | bit
+            if n == 2:
+                state.step = True
+            else:
+                delta = ord(states[1].char) - ord(states[0].char)
+                state.step = prev.step and ord(c) - ord(prev.char) == delta
+            forward = prev.forward
+            backward = prev.backward
+            state.mask = self._adjacency.get(prev.char, _EMPTY).get(c, 0)
+            state.walk_covered = prev.walk_covered
+            state.walk_end = prev.walk_end
+
+        # ends of the password in the keyboard rows, and starts of the
+        # reversed password, see safe.is_asdf
+        asdf = _ASDF
+        state.forward = tuple(
+            e + 1 for e in forward if e < len(asdf) and asdf[e] == c
+        )
+        state.backward = tuple(
+            s - 1 for s in backward if s > 0 and asdf[s - 1] == c
+        )
+
+        # the window of the last 3 pairs, see safe.keyboard.walk_coverage
+        if self._walk and n >= _WALK_RUN:
+            bits = state.mask & states[-1].mask & states[-2].mask
+            if bits:
+                start = n - _WALK_RUN
+                state.walk_covered += n - max(start, state.walk_end)
+                state.walk_end = n
+
+        state.lower = state.leet = 0
+        state.marked = ()
+        if self._words:
+            self._push_words(state, prev, c, n)
+        states.append(state)
+
+    def _push_words(self, state, prev, c, n):
+        automaton = self._automaton
+        if automaton is None:
+            automaton = _automaton.get(self.policy.cache_words)
+            self._automaton = automaton
+
+        covered = self._covered
+        covered.append(False)
+        start = n
+        lower = automaton._step(
+            prev.lower if prev else 0, ord(c.translate(_LOWER))
+        )
+        state.lower = lower
+        start = min(start, self._longest(automaton, lower, n))
+        if self.policy.leet:
+            leet = automaton._step(
+                prev.leet if prev else 0, ord(c.translate(_LOWER_LEET))
+            )
+            state.leet = leet
+            start = min(start, self._longest(automaton, leet, n))
+
+        # words found here all end at this character
+        marked = []
+        for i in range(start, n):
+            if not covered[i]:
+                covered[i] = True
+                marked.append(i)
+        self._word_count += len(marked)
+        state.marked = marked
+
+    @staticmethod
+    def _longest(automaton, state, n):
+        """Start of the longest word ending at the state."""
+        freqs = automaton.freqs
+        match = state if freqs[state] else automaton.output[state]
+        if not match:
+            return n
+        return n - automaton.depths[match]
+
+    def _pop(self):
+        state = self._states.pop()
+        if self._words:
+            covered = self._covered
+            for i in state.marked:
+                covered[i] = False
+            self._word_count -= len(state.marked)
+            covered.pop()
@@ -0,0 +1,246 @@
+# coding: utf-8
+"""
+    safe.keyboard
+
+    Detect walks on keyboards, e.g. ``1qaz2wsx``, ``zaq!xsw@`` and
+    ``7896321``. Adjacency graphs of several layouts are built once on
+    first use, a password is scanned in a single pass over all layouts.
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import sys
+import threading
+from ._compat import to_unicode
+
+__all__ = ['LAYOUTS', 'LAYOUT_NAMES', 'find_walks', 'walk_coverage']
+
+# rows of (unshifted, shifted) keys, and the horizontal offset of rows
+_SLANTED_OFFSETS = (0, 0.5, 0.75, 1.25)
+
+_QWERTY = (
+    (u'`1234567890-=', u'~!@#$%^&*()_+'),
+    (u'qwertyuiop[]\\', u'QWERTYUIOP{}|'),
+    (u"asdfghjkl;'", u'ASDFGHJKL:"'),
+    (u'zxcvbnm,./', u'ZXCVBNM<>?'),
+)
+
+_QWERTZ = (
+    (u'^1234567890\xdf\xb4', u'\xb0!"\xa7$%&/()=?`'),
+    (u'qwertzuiop\xfc+', u'QWERTZUIOP\xdc*'),
+    (u'asdfghjkl\xf6\xe4#', u"ASDFGHJKL\xd6\xc4'"),
+    (u'<yxcvbnm,.-', u'>YXCVBNM;:_'),
+)
+
+_AZERTY = (
+    (u'\xb2&\xe9"\'(-\xe8_\xe7\xe0)=', u'\xb01234567890\xb0+'),
+    (u'azertyuiop^$', u'AZERTYUIOP\xa8\xa3'),
+    (u'qsdfghjklm\xf9*', u'QSDFGHJKLM%\xb5'),
+    (u'<wxcvbn,;:!', u'>WXCVBN?./\xa7'),
+)
+
+_DVORAK = (
+    (u'`1234567890[]', u'~!@#$%^&*(){}'),
+    (u"',.pyfgcrl/=\\", u'"<>PYFGCRL?+|'),
+    (u'aoeuidhtns-', u'AOEUIDHTNS_'),
+    (u';qjkxbmwvz', u':QJKXBMWVZ'),
+)
+
+_NUMPAD = (
+    (u' /*-', u' /*-'),
+    (u'789+', u'789+'),
+    (u'456', u'456'),
+    (u'123', u'123'),
+    (u' 0.', u' 0.'),
+)
+
+
+def _build(rows, offsets, diagonal=False):
+    """Build the adjacency graph of a layout, which maps a character to
+    the set of characters on its neighbor keys.
+    """
+    # keys of every row, as (x, chars)
+    keys = []
+    for y, (lower, upper) in enumerate(rows):
+        row = []
+        for x, chars in enumerate(zip(lower, upper)):
+            chars = u''.join(c for c in chars if c != u' ')
+            if chars:
+                row.append((x + offsets[y], chars))
+        keys.append(row)
+
+    # neighbors are only on the same row and the rows above and below
+    graph = {}
+    for y, row in enumerate(keys):
+        for x1, chars1 in row:
+            neighbors = set()
+            for y2 in (y - 1, y, y + 1):
+                if y2 < 0 or y2 >= len(keys):
+                    continue
+                for x2, chars2 in keys[y2]:
+                    dx = abs(x1 - x2)
+                    if y2 == y:
+                        if dx == 1:
+                            neighbors.update(chars2)
+                    elif dx < 1 or diagonal and dx <= 1:
+                        neighbors.update(chars2)
+            for c in chars1:
+                graph.setdefault(c, set()).update(neighbors)
+
+    # wrap the last letter or digit of a row to the first one of the
+    # next row, e.g. "op" to "as"
+    def edge(y, index):
+        lower, upper = rows[y]
+        pairs = [(a, b) for a, b in zip(lower, upper) if a.isalnum()]
+        return set(pairs[index]) if pairs else set()
+
+    for y in range(len(rows) - 1):
+        last = edge(y, -1)
+        first = edge(y + 1, 0)
+        for c in last:
+            graph[c].update(first)
+        for c in first:
+            graph[c].update(last)
+
+    return dict((c, frozenset(n)) for c, n in graph.items())
+
+
+# rows, offsets of rows and diagonal neighbors of every layout
+_SPECS = {
+    'qwerty': (_QWERTY, _SLANTED_OFFSETS, False),
+    'qwertz': (_QWERTZ, _SLANTED_OFFSETS, False),
+    'azerty': (_AZERTY, _SLANTED_OFFSETS, False),
+    'dvorak': (_DVORAK, _SLANTED_OFFSETS, False),
+    'numpad': (_NUMPAD, (0, 0, 0, 0, 0), True),
+}
+
+#: names of layouts, the index of a layout is its bit in adjacency masks
+LAYOUT_NAMES = tuple(sorted(_SPECS))
+
+_graphs = None
+_lock = threading.Lock()
+
+
+def _load():
+    """Build the adjacency graphs of all layouts on first use. It
+    returns ``(layouts, adjacency)``, where ``adjacency`` is all layouts
+    merged, ``adjacency[a][b]`` is the bitmask of layouts on which ``b``
+    is a neighbor of ``a``.
+    """
+    global _graphs
+    graphs = _graphs
+    if graphs is None:
+        with _lock:
+            if _graphs is None:
+                layouts = dict(
+                    (name, _build(*spec)) for name, spec in _SPECS.items()
+                )
+                adjacency = {}
+                for bit, name in enumerate(LAYOUT_NAMES):
+                    for c, neighbors in layouts[name].items():
+                        row = adjacency.setdefault(c, {})
+                        for n in neighbors:
+                            row[n] = row.get(n, 0) | (1 << bit)
+                _graphs = layouts, adjacency
+            graphs = _graphs
+    return graphs
+
+
+def __getattr__(name):
+    """Build ``LAYOUTS``, the adjacency graphs of keyboard layouts, on
+    first access.
+    """
+    if name == 'LAYOUTS':
+        return _load()[0]
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name)
+    )
+
+
+if sys.version_info < (3, 7):
+    # module __getattr__ is not supported, build the graphs now
+    LAYOUTS = _load()[0]
+
+_EMPTY = {}
+
+
+def _allowed(layouts):
+    if layouts is None:
+        return (1 << len(LAYOUT_NAMES)) - 1
+    allowed = 0
+    for name in layouts:
+        allowed |= 1 << LAYOUT_NAMES.index(name)
+    return allowed
+
+
+def find_walks(raw, min_run=4, layouts=None):
+    """Find walks on keyboards in the password, in a single pass over
+    all layouts. It returns a list of ``(start, end, layout)`` of walks
+    with at least ``min_run`` characters, walks on different layouts may
+    overlap.
+
+    :param raw: raw text password.
+    :param min_run: minimal length of a walk.
+    :param layouts: names of layouts, defaults to all layouts.
+    """
+    raw = to_unicode(raw)
+    masks = _masks(raw, _allowed(layouts))
+    masks.append(0)
+
+    walks = []
+    starts = [0] * len(LAYOUT_NAMES)
+    active = 0
+    for i, bits in enumerate(masks, 1):
+        if bits == active:
+            continue
+        ended = active & ~bits
+        started = bits & ~active
+        bit = 0
+        while ended or started:
+            if ended & 1 and i - starts[bit] >= min_run:
+                walks.append((starts[bit], i, LAYOUT_NAMES[bit]))
+            if started & 1:
+                starts[bit] = i - 1
+            ended >>= 1
+            started >>= 1
+            bit += 1
+        active = bits
+    return walks
+
+
+def _masks(raw, allowed):
+    adjacency = _load()[1]
+    return [
+        adjacency.get(a, _EMPTY).get(b, 0) & allowed
+        for a, b in zip(raw, raw[1:])
+    ]
+
+
+def walk_coverage(raw, min_run=4, layouts=None):
+    """The fraction of characters of the password which are covered by
+    walks on keyboards, from ``0.0`` to ``1.0``. Parameters are the
+    same as :meth:`find_walks`.
+    """
+    raw = to_unicode(raw)
+    if len(raw) < min_run:
+        return 0.0
+    masks = _masks(raw, _allowed(layouts))
+    if not any(masks):
+        return 0.0
+
+    # a walk of ``min_run`` characters is a window of ``min_run - 1``
+    # pairs which are adjacent on the same layout
+    width = min_run - 1
+    covered = 0
+    end = 0
+    for i in range(len(masks) - width + 1):
+        bits = masks[i]
+        j = 1
+        while bits and j < width:
+            bits &= masks[i + j]
+            j += 1
+        if bits:
+            stop = i + min_run
+            covered += stop - max(i, end)
+            end = stop
+    return covered / float(len(raw))
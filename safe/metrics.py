@@ -0,0 +1,102 @@
+# coding: utf-8
+"""
+    safe.metrics
+
+    Instrumentation of safe. Metrics are sent to a recorder, which is any
+    object with two methods::
+
+        class Recorder(object):
+            def incr(self, name, value=1):
+                # a counter, e.g. ``check.level.strong``
+            def timing(self, name, seconds):
+                # a duration, e.g. ``stage.words``
+
+    It is easy to adapt a statsd or Prometheus client into a recorder.
+    Metrics are recorded only when a recorder is set, otherwise the cost
+    is a single check of ``None``::
+
+        >>> stats = safe.metrics.Stats()
+        >>> safe.metrics.set_recorder(stats)
+
+    Names of metrics:
+
+    - ``check.level.<level>``, ``check.message.<code>``: outcome counts
+    - ``stage.<stage>``: timings of checking stages, which are
+      ``pattern``, ``walk``, ``common``, ``similar``, ``words``,
+      ``types`` and ``guesses``
+    - ``cache.<name>.hit``, ``cache.<name>.miss``, ``cache.<name>.stale``,
+      ``cache.<name>.corrupt``: reads of cache files, name is ``words``,
+      ``automaton`` or ``trie``
+    - ``cache.<name>.error``: cache files which can not be written, the
+      value is used in memory
+    - ``load.<name>``: timings of loading the words, the automaton or
+      the trie
+    - ``verdicts.hit``, ``verdicts.miss``: lookups of
+      :class:`~safe.VerdictCache`
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import threading
+
+__all__ = ['set_recorder', 'get_recorder', 'Stats']
+
+#: the current recorder, ``None`` when metrics are disabled
+recorder = None
+
+
+def set_recorder(obj):
+    """Send metrics to the recorder, or disable metrics with ``None``."""
+    global recorder
+    recorder = obj
+
+
+def get_recorder():
+    """The current recorder, or ``None``."""
+    return recorder
+
+
+def incr(name, value=1):
+    if recorder is not None:
+        recorder.incr(name, value)
+
+
+def timing(name, seconds):
+    if recorder is not None:
+        recorder.timing(name, seconds)
+
+
+class Stats(object):
+    """A recorder which keeps metrics in memory, it is useful in tests
+    and for exporting metrics periodically::
+
+        >>> stats.counters['check.level.strong']
+        42
+        >>> stats.timings['load.words']
+        {'count': 1, 'total': 0.012, 'max': 0.012}
+    """
+    def __init__(self):
+        self.counters = {}
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def timing(self, name, seconds):
+        with self._lock:
+            item = self.timings.get(name)
+            if item is None:
+                item = self.timings[name] = {
+                    'count': 0, 'total': 0.0, 'max': 0.0
+                }
+            item['count'] += 1
+            item['total'] += seconds
+            if seconds > item['max']:
+                item['max'] = seconds
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timings = {}
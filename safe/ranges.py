@@ -0,0 +1,383 @@
+# coding: utf-8
+"""
+    safe.ranges
+
+    A word list backend of breached passwords behind a range API, in the
+    way of `Pwned Passwords <https://haveibeenpwned.com/API/v3>`_. Only
+    the first characters of the SHA-1 of a password are sent, the
+    response is every known suffix with that prefix, which is matched
+    locally::
+
+        >>> words = RangeWords()
+        >>> safe.check('P@ssw0rd', words=words)
+        simple
+
+    Lookups of concurrent threads sharing a prefix are coalesced into a
+    single request, responses are cached for a while, and connections
+    are kept alive in a pool.
+
+    Range files can be built from a ``word freq`` text file, and served
+    from a directory, for testing or running without internet::
+
+        $ python -m safe.ranges build words.txt ranges/
+        $ python -m safe.ranges serve ranges/ --port 8000
+
+        >>> words = RangeWords('http://127.0.0.1:8000/range/')
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import os
+import sys
+import time
+import socket
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from ._compat import to_unicode
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlparse
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    import queue
+except ImportError:  # pragma: no cover
+    import httplib
+    from urlparse import urlparse
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    import Queue as queue
+
+__all__ = ['RangeWords', 'build_ranges', 'serve']
+
+#: the range API of Pwned Passwords
+PWNED_URL = 'https://api.pwnedpasswords.com/range/'
+
+_HEX = frozenset('0123456789ABCDEF')
+_timer = getattr(time, 'monotonic', time.time)
+
+
+def _digest(word):
+    data = to_unicode(word).encode('utf-8', 'surrogatepass')
+    return hashlib.sha1(data).hexdigest().upper()
+
+
+def _parse(body):
+    """Parse a range response of ``SUFFIX:COUNT`` lines."""
+    counts = {}
+    for line in body.decode('ascii', 'replace').splitlines():
+        suffix, _, count = line.partition(':')
+        try:
+            count = int(count)
+        except ValueError:
+            continue
+        # padding entries have a zero count
+        if count:
+            counts[suffix.strip().upper()] = count
+    return counts
+
+
+class _Pending(object):
+    """A range request in flight, which other threads wait for."""
+    def __init__(self):
+        self._event = threading.Event()
+        self.counts = None
+        self.error = None
+
+    def set(self, counts, error=None):
+        self.counts = counts
+        self.error = error
+        self._event.set()
+
+    def wait(self, timeout=None):
+        self._event.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.counts
+
+
+class RangeWords(object):
+    """A word list backend querying a range API. The frequency of a word
+    is the number of times it appears in breaches.
+
+    :param url: the base url of the range API, the prefix is appended.
+    :param prefix_length: number of hex characters of the prefix.
+    :param pool_size: maximum concurrent requests and kept connections.
+    :param cache_size: maximum number of cached prefixes.
+    :param ttl: seconds to cache a prefix.
+    :param timeout: seconds of connecting and reading.
+    """
+    def __init__(self, url=PWNED_URL, prefix_length=5, pool_size=4,
+                 cache_size=4096, ttl=3600, timeout=10.0):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported url %s' % url)
+        self.url = url
+        self.prefix_length = prefix_length
+        self.pool_size = pool_size
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.timeout = timeout
+
+        self._https = parsed.scheme == 'https'
+        self._host = parsed.hostname
+        self._port = parsed.port
+        self._path = parsed.path.rstrip('/') + '/'
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._cache = OrderedDict()
+        #: number of requests sent
+        self.requests = 0
+        #: number of lookups answered by the cache
+        self.hits = 0
+        #: number of lookups which waited for a request of another thread
+        self.coalesced = 0
+
+    def __reduce__(self):
+        # connections are not shared with other processes
+        return RangeWords, (
+            self.url, self.prefix_length, self.pool_size, self.cache_size,
+            self.ttl, self.timeout,
+        )
+
+    def get(self, word, default=None):
+        digest = _digest(word)
+        counts = self._range(digest[:self.prefix_length])
+        return counts.get(digest[self.prefix_length:], default)
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def get_many(self, words, default=None):
+        """Look up many words, every distinct prefix is requested once,
+        and at most ``pool_size`` prefixes are requested concurrently.
+        It returns a list of frequencies in the same order.
+        """
+        digests = [_digest(word) for word in words]
+        n = self.prefix_length
+        prefixes = sorted(set(d[:n] for d in digests))
+        ranges = {}
+        if len(prefixes) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            workers = min(self.pool_size, len(prefixes))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for prefix, counts in zip(
+                        prefixes, executor.map(self._range, prefixes)):
+                    ranges[prefix] = counts
+        else:
+            for prefix in prefixes:
+                ranges[prefix] = self._range(prefix)
+        return [ranges[d[:n]].get(d[n:], default) for d in digests]
+
+    def close(self):
+        """Close kept connections."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _range(self, prefix):
+        with self._lock:
+            item = self._cache.get(prefix)
+            if item is not None:
+                counts, expires = item
+                if expires > _timer():
+                    del self._cache[prefix]
+                    self._cache[prefix] = item
+                    self.hits += 1
+                    return counts
+                del self._cache[prefix]
+            pending = self._pending.get(prefix)
+            owner = pending is None
+            if owner:
+                pending = self._pending[prefix] = _Pending()
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return pending.wait()
+
+        try:
+            counts = self._fetch(prefix)
+        except Exception as e:
+            with self._lock:
+                del self._pending[prefix]
+            pending.set(None, e)
+            raise
+
+        with self._lock:
+            cache = self._cache
+            cache[prefix] = (counts, _timer() + self.ttl)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+            del self._pending[prefix]
+        pending.set(counts)
+        return counts
+
+    def _connect(self):
+        if self._https:
+            return httplib.HTTPSConnection(
+                self._host, self._port, timeout=self.timeout
+            )
+        return httplib.HTTPConnection(
+            self._host, self._port, timeout=self.timeout
+        )
+
+    def _fetch(self, prefix):
+        with self._slots:
+            try:
+                conn = self._pool.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn = self._connect()
+                reused = False
+            try:
+                status, body, close = self._request(conn, prefix)
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if not reused:
+                    raise
+                # the kept connection was closed by the server
+                conn = self._connect()
+                try:
+                    status, body, close = self._request(conn, prefix)
+                except BaseException:
+                    conn.close()
+                    raise
+
+            if close:
+                conn.close()
+            else:
+                try:
+                    self._pool.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+
+        if status == 404:
+            return {}
+        if status != 200:
+            raise IOError('Range %s responded %d' % (prefix, status))
+        return _parse(body)
+
+    def _request(self, conn, prefix):
+        with self._lock:
+            self.requests += 1
+        conn.request('GET', self._path + prefix, headers={
+            'User-Agent': 'safe-ranges',
+            'Connection': 'keep-alive',
+        })
+        resp = conn.getresponse()
+        # the body is read to the end, to reuse the connection
+        body = resp.read()
+        return resp.status, body, resp.will_close
+
+
+def build_ranges(words, directory, prefix_length=5):
+    """Write range files of words into a directory, a file per prefix,
+    named by the prefix.
+
+    :param words: a mapping of ``word -> freq``.
+    :param directory: the directory of range files.
+    :param prefix_length: number of hex characters of the prefix.
+    """
+    ranges = {}
+    for word, freq in words.items():
+        digest = _digest(word)
+        prefix = digest[:prefix_length]
+        ranges.setdefault(prefix, []).append((digest[prefix_length:], freq))
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for prefix, items in ranges.items():
+        with open(os.path.join(directory, prefix), 'wb') as f:
+            for suffix, freq in sorted(items):
+                f.write(('%s:%d\r\n' % (suffix, freq)).encode('ascii'))
+    return len(ranges)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serve range files of :attr:`directory` at ``/range/<prefix>``,
+    a missing file is an empty range.
+    """
+    protocol_version = 'HTTP/1.1'
+    directory = '.'
+
+    def do_GET(self):
+        prefix = self.path.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+        prefix = prefix.upper()
+        if not prefix or len(prefix) > 40 or not _HEX.issuperset(prefix):
+            self.send_error(400, 'Invalid prefix')
+            return
+        try:
+            with open(os.path.join(self.directory, prefix), 'rb') as f:
+                body = f.read()
+        except (IOError, OSError):
+            body = b''
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(directory, host='127.0.0.1', port=8000):
+    """Create a threaded server of range files, call ``serve_forever``
+    of the result to run it. The port is chosen by the OS when it is
+    ``0``, it is ``server.server_address[1]``.
+    """
+    handler = type('RangeHandler', (RangeHandler,), {
+        'directory': os.path.abspath(directory),
+    })
+    return _Server((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Range files of words.')
+    commands = parser.add_subparsers(dest='command')
+    build = commands.add_parser('build', help='build range files')
+    build.add_argument('source', help='a word freq text file')
+    build.add_argument('directory', help='directory of range files')
+    build.add_argument('--prefix-length', type=int, default=5)
+    run = commands.add_parser('serve', help='serve range files')
+    run.add_argument('directory', help='directory of range files')
+    run.add_argument('--host', default='127.0.0.1')
+    run.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        from .wordlist import read_words
+        count = build_ranges(
+            read_words(args.source), args.directory, args.prefix_length
+        )
+        sys.stderr.write('Built %d range files\n' % count)
+    elif args.command == 'serve':
+        server = serve(args.directory, args.host, args.port)
+        sys.stderr.write('Serving %s on http://%s:%d/range/\n' % (
+            args.directory, args.host, server.server_address[1],
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
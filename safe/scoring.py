@@ -0,0 +1,253 @@
+# coding: utf-8
+"""
+    safe.scoring
+
+    Estimate how many guesses an attacker needs to crack a password, in
+    the way of zxcvbn. The password is split into the cheapest sequence
+    of patterns:
+
+    - common words, ranked by their frequency, with case and leet
+      variations
+    - walks on keyboards
+    - sequences of characters, e.g. ``abcd``, ``1357``
+    - repeated characters or chunks, e.g. ``aaaa``, ``abcabc``
+    - years and dates, e.g. ``1987``, ``2024-01-31``
+
+    and other characters are brute forced. The decomposition is a
+    dynamic programming over candidate patterns, it costs linear time in
+    the length of the password and the number of patterns.
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import re
+import math
+from bisect import bisect_right
+from ._compat import to_unicode
+from .keyboard import _load as _load_keyboards, find_walks
+from .dictionary import _LOWER, _LOWER_LEET
+
+__all__ = ['estimate']
+
+# guesses of a brute forced character
+BRUTEFORCE_CARDINALITY = 10
+# minimal guesses of a pattern
+MIN_GUESSES = 10
+# every extra pattern in the sequence doubles the guesses
+PATTERN_PENALTY = math.log10(2)
+
+REFERENCE_YEAR = 2020
+MIN_YEAR_SPACE = 20
+
+_YEAR = re.compile(r'(?:19|20)\d\d')
+_DATE = re.compile(
+    r'(\d{1,4})([\s/._-]?)(\d{1,2})\2(\d{1,4})'
+)
+_REPEAT = re.compile(r'(.{1,4}?)\1{2,}|(.{2,4}?)\2+', re.S)
+
+# average degree and number of keys of keyboard layouts
+_WALK_SPACE = dict(
+    (name, (len(graph), sum(len(n) for n in graph.values()) / len(graph)))
+    for name, graph in _load_keyboards()[0].items()
+)
+
+
+def _log(n):
+    return math.log10(max(n, 1))
+
+
+def _variations(text):
+    """Guesses multiplier of upper case variations."""
+    upper = sum(1 for c in text if c.isupper())
+    if not upper:
+        return 1
+    lower = sum(1 for c in text if c.islower())
+    if not lower or upper == 1 and text[0].isupper():
+        return 2
+    # choose the upper case letters from all letters
+    total = 0
+    for k in range(1, min(upper, lower) + 1):
+        total += _choose(upper + lower, k)
+    return total
+
+
+def _choose(n, k):
+    if k > n:
+        return 0
+    result = 1
+    for i in range(1, k + 1):
+        result = result * (n - k + i) // i
+    return result
+
+
+def _dictionary_matches(raw, automaton, leet):
+    ranks = automaton.ranks()
+    total = len(ranks)
+    lower = raw.translate(_LOWER)
+    found = set()
+    automaton._scan(lower, found)
+    matches = []
+    for (i, j, freq) in found:
+        rank = total - bisect_right(ranks, freq) + 1
+        guesses = rank * _variations(raw[i:j])
+        matches.append((i, j, 'dictionary', _log(guesses)))
+
+    if leet:
+        normal = raw.translate(_LOWER_LEET)
+        if normal != lower:
+            leeted = set()
+            automaton._scan(normal, leeted)
+            for (i, j, freq) in leeted:
+                if (i, j, freq) in found:
+                    continue
+                rank = total - bisect_right(ranks, freq) + 1
+                subs = sum(1 for a, b in zip(lower[i:j], normal[i:j])
+                           if a != b)
+                guesses = rank * _variations(raw[i:j]) * 2 ** subs
+                matches.append((i, j, 'dictionary', _log(guesses)))
+    return matches
+
+
+def _walk_matches(raw):
+    matches = []
+    for i, j, name in find_walks(raw, min_run=3):
+        keys, degree = _WALK_SPACE[name]
+        guesses = keys * degree * (j - i)
+        if any(not c.isalnum() or c.isupper() for c in raw[i:j]):
+            guesses *= 2
+        matches.append((i, j, 'walk', _log(guesses)))
+    return matches
+
+
+def _sequence_matches(raw):
+    """Maximal runs with a constant step, like :meth:`safe.is_by_step`."""
+    matches = []
+    n = len(raw)
+    i = 0
+    while i < n - 2:
+        delta = ord(raw[i + 1]) - ord(raw[i])
+        j = i + 2
+        while j < n and ord(raw[j]) - ord(raw[j - 1]) == delta:
+            j += 1
+        if j - i >= 3 and 0 < abs(delta) <= 5:
+            first = raw[i]
+            if first in u'aAzZ019':
+                base = 4
+            elif first.isdigit():
+                base = 10
+            else:
+                base = 26
+            if delta < 0:
+                base *= 2
+            matches.append((i, j, 'sequence', _log(base * (j - i))))
+        # maximal runs only share their boundaries, which keeps it linear
+        i = j - 1
+    return matches
+
+
+def _repeat_matches(raw, bruteforce):
+    matches = []
+    for m in _REPEAT.finditer(raw):
+        unit = m.group(1) or m.group(2)
+        count = (m.end() - m.start()) // len(unit)
+        guesses = max(bruteforce(unit), MIN_GUESSES) * count
+        matches.append((m.start(), m.end(), 'repeat', _log(guesses)))
+    return matches
+
+
+def _date_matches(raw):
+    matches = []
+    for m in _YEAR.finditer(raw):
+        year = int(m.group())
+        space = max(abs(year - REFERENCE_YEAR), MIN_YEAR_SPACE)
+        matches.append((m.start(), m.end(), 'date', _log(space)))
+
+    for m in _DATE.finditer(raw):
+        a, sep, b, c = m.groups()
+        if not sep and len(a + b + c) not in (6, 8):
+            continue
+        if not _is_date(a, b, c):
+            continue
+        guesses = 365 * MIN_YEAR_SPACE
+        if sep:
+            guesses *= 4
+        matches.append((m.start(), m.end(), 'date', _log(guesses)))
+    return matches
+
+
+def _is_date(a, b, c):
+    """If the numbers are a date in year-month-day, day-month-year or
+    month-day-year order."""
+    a, b, c = int(a), int(b), int(c)
+    for year, month, day in ((a, b, c), (c, b, a), (c, a, b)):
+        if 1 <= month <= 12 and 1 <= day <= 31 and (
+                year < 100 or 1900 <= year <= 2099):
+            return True
+    return False
+
+
+def _bruteforce(text):
+    return BRUTEFORCE_CARDINALITY ** len(text)
+
+
+def estimate(raw, automaton=None, leet=True):
+    """Estimate the guesses to crack the password. It returns a tuple of
+    ``(log10 guesses, patterns)``, where ``patterns`` is the cheapest
+    decomposition of the password, a list of ``(start, end, kind, log10
+    guesses)``.
+
+    :param raw: raw text password.
+    :param automaton: a :class:`~safe.dictionary.Automaton` of common
+                      words, no words are matched without it.
+    :param leet: match common words with leet substitutions.
+    """
+    raw = to_unicode(raw)
+    n = len(raw)
+    if not n:
+        return 0.0, []
+
+    candidates = []
+    if automaton is not None:
+        candidates.extend(_dictionary_matches(raw, automaton, leet))
+    candidates.extend(_walk_matches(raw))
+    candidates.extend(_sequence_matches(raw))
+    candidates.extend(_repeat_matches(raw, _bruteforce))
+    candidates.extend(_date_matches(raw))
+
+    ending = [[] for _ in range(n + 1)]
+    for match in candidates:
+        ending[match[1]].append(match)
+
+    # best[j] is the minimal log10 guesses of raw[:j], a brute forced
+    # character extends the previous brute force run without a penalty
+    brute = math.log10(BRUTEFORCE_CARDINALITY)
+    minimal = math.log10(MIN_GUESSES)
+    best = [0.0] * (n + 1)
+    back = [None] * (n + 1)
+    for j in range(1, n + 1):
+        best[j] = best[j - 1] + brute
+        back[j] = None
+        for match in ending[j]:
+            i = match[0]
+            cost = best[i] + max(match[3], minimal)
+            if i:
+                cost += PATTERN_PENALTY
+            if cost < best[j]:
+                best[j] = cost
+                back[j] = match
+
+    patterns = []
+    j = n
+    while j > 0:
+        match = back[j]
+        if match is None:
+            i = j - 1
+            while i > 0 and back[i] is None:
+                i -= 1
+            patterns.append((i, j, 'bruteforce', brute * (j - i)))
+            j = i
+        else:
+            patterns.append(match)
+            j = match[0]
+    patterns.reverse()
+    return best[n], patterns
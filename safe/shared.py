@@ -0,0 +1,148 @@
+# coding: utf-8
+"""
+    safe.shared
+
+    Share a single copy of the compiled word list between processes
+    through :mod:`multiprocessing.shared_memory`. One loader process
+    publishes the words, and every worker attaches to the same block,
+    memory of the words is the same for 1 worker or 64::
+
+        # in the loader, e.g. the master of a prefork server
+        words = SharedWords.create(name='safe-words')
+
+        # in workers
+        words = SharedWords.attach('safe-words')
+        safe.check(password, words=words)
+
+    Workers attach to the block automatically when the environment
+    variable ``PYTHON_SAFE_WORDS_SHM`` is the name of the block. A
+    standalone loader is started with::
+
+        $ python -m safe.shared --name safe-words
+
+    Attaching only maps the block, nothing is parsed or copied.
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import io
+import sys
+import signal
+import argparse
+from multiprocessing import shared_memory
+from .wordlist import MappedWords, read_words, compile_words
+
+__all__ = ['SharedWords']
+
+# names of blocks created by this process, they are tracked already
+_created = set()
+
+
+class SharedWords(MappedWords):
+    """A :class:`~safe.wordlist.MappedWords` over a named shared memory
+    block. Create it with :meth:`create` or attach to it with
+    :meth:`attach`.
+
+    :param shm: a :class:`multiprocessing.shared_memory.SharedMemory`.
+    """
+    def __init__(self, shm):
+        self.shm = shm
+        self.name = shm.name
+        # slices of the mmap are bytes, which are compared with words
+        MappedWords.__init__(self, shm._mmap)
+
+    @classmethod
+    def create(cls, words=None, name=None):
+        """Compile the words into a new shared memory block. The creator
+        owns the block, and should :meth:`unlink` it when it is done.
+
+        :param words: a mapping of ``word -> freq``, defaults to the
+                      bundled words.
+        :param name: name of the block, a random name by default.
+        """
+        if words is None:
+            from . import _words_file
+            words = read_words(_words_file())
+        data = io.BytesIO()
+        compile_words(words, data)
+        data = data.getbuffer()
+        shm = shared_memory.SharedMemory(name=name, create=True,
+                                         size=len(data))
+        shm.buf[:len(data)] = data
+        _created.add(shm.name)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to a shared memory block created by :meth:`create`."""
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # before python 3.13, attaching registers the block in the
+            # resource tracker, which would unlink it on exit
+            shm = shared_memory.SharedMemory(name=name)
+            if shm.name not in _created:
+                _untrack(shm)
+        return cls(shm)
+
+    def close(self):
+        """Detach from the block, the words can not be used anymore."""
+        # views of the block must be released before it is closed
+        self._offsets = self._freqs = self._buf = None
+        self._hashes = self._table = None
+        self.shm.close()
+
+    def unlink(self):
+        """Destroy the block, it is called by the creator."""
+        _created.discard(self.name)
+        self.shm.unlink()
+
+    def __del__(self):
+        if self._buf is not None:
+            self.close()
+
+    def __reduce__(self):
+        # workers of a pool attach to the block instead of a copy
+        return SharedWords.attach, (self.name,)
+
+
+def _untrack(shm):
+    from multiprocessing import resource_tracker
+    try:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Publish a word list in shared memory.',
+    )
+    parser.add_argument('words', nargs='?', help='a word freq text file')
+    parser.add_argument('--name', default='safe-words',
+                        help='name of the shared memory block')
+    args = parser.parse_args(argv)
+
+    words = read_words(args.words) if args.words else None
+    shared = SharedWords.create(words, name=args.name)
+    sys.stderr.write('Published %d words in %s, %d bytes\n' % (
+        len(shared), shared.name, shared.shm.size,
+    ))
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while True:
+            signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shared.close()
+        shared.unlink()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
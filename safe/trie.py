@@ -0,0 +1,295 @@
+# coding: utf-8
+"""
+    safe.trie
+
+    A compact trie of words and their frequencies, in flat uint32
+    arrays. States are numbered in breadth first order, and edges are
+    stored in the order of their source states, so the target of the
+    ``i``-th edge is the state ``i + 1``, targets are not stored::
+
+        magic   8 bytes, b'SAFETR\\x00\\x01'
+        states  number of states, S
+        first   S + 1 indexes of the first edge of every state
+        labels  S - 1 code points of edges, sorted in every state
+        freqs   S frequencies of words ending at every state
+
+    The trie is saved into a single buffer and read in place. Besides
+    exact lookups, it finds words which are prefixes of a password,
+    words starting with a prefix, and words within a small edit
+    distance of a password.
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import mmap
+import struct
+from bisect import bisect_left, bisect_right
+from array import array
+from collections import deque
+from ._compat import to_unicode, unichr
+from .wordlist import _uint_array
+
+__all__ = ['Trie']
+
+MAGIC = b'SAFETR\x00\x01'
+_HEADER = struct.Struct('<8sI')
+
+
+class Trie(object):
+    """A read only mapping of ``word -> freq`` in a compact trie. Build
+    it with :meth:`build` or load it with :meth:`load`.
+    """
+    def __init__(self, first, labels, freqs):
+        self.first = first
+        self.labels = labels
+        self.freqs = freqs
+        self._count = None
+
+    @classmethod
+    def build(cls, words):
+        """Build the trie from a mapping of ``word -> freq``."""
+        children = [{}]
+        freqs = [0]
+        for word, freq in words.items():
+            state = 0
+            for c in to_unicode(word):
+                nxt = children[state].get(ord(c))
+                if nxt is None:
+                    nxt = len(children)
+                    children[state][ord(c)] = nxt
+                    children.append({})
+                    freqs.append(0)
+                state = nxt
+            freqs[state] = max(freqs[state], freq or 1)
+
+        size = len(children)
+        first = array('I', [0]) * (size + 1)
+        labels = array('I')
+        new_freqs = array('I', [0]) * size
+        # breadth first, the target of every appended edge is the next
+        # numbered state
+        queue = deque([0])
+        state = 0
+        while queue:
+            old = queue.popleft()
+            first[state] = len(labels)
+            new_freqs[state] = freqs[old]
+            for c in sorted(children[old]):
+                labels.append(c)
+                queue.append(children[old][c])
+            state += 1
+        first[size] = len(labels)
+        return cls(first, labels, new_freqs)
+
+    @classmethod
+    def load(cls, filename):
+        """Map a saved trie into memory."""
+        with open(filename, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_buffer(buf)
+
+    @classmethod
+    def from_buffer(cls, buf):
+        """Read a saved trie in place from a buffer, e.g. a mmap."""
+        if len(buf) < _HEADER.size:
+            raise ValueError('Invalid trie')
+        magic, states = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or not states:
+            raise ValueError('Invalid trie')
+        if len(buf) < _HEADER.size + (states * 3) * 4:
+            raise ValueError('Truncated trie')
+        offset = _HEADER.size
+        arrays = []
+        for count in (states + 1, states - 1, states):
+            arrays.append(_uint_array(buf, offset, count))
+            offset += count * 4
+        return cls(*arrays)
+
+    def save(self, fileobj):
+        """Write the trie into a file object in binary mode."""
+        states = len(self.freqs)
+        fileobj.write(_HEADER.pack(MAGIC, states))
+        for values in (self.first, self.labels, self.freqs):
+            fileobj.write(struct.pack('<%dI' % len(values), *values))
+
+    def _child(self, state, c):
+        lo = self.first[state]
+        hi = self.first[state + 1]
+        i = bisect_left(self.labels, c, lo, hi)
+        if i < hi and self.labels[i] == c:
+            return i + 1
+        return -1
+
+    def _walk(self, text):
+        state = 0
+        for c in text:
+            state = self._child(state, ord(c))
+            if state < 0:
+                break
+        return state
+
+    def get(self, word, default=None):
+        state = self._walk(to_unicode(word))
+        if state < 0 or not self.freqs[state]:
+            return default
+        return self.freqs[state]
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def prefixes(self, raw):
+        """Words which are prefixes of the password, e.g. ``password``
+        of ``password123``. It returns a list of ``(length, freq)``,
+        shortest first.
+        """
+        raw = to_unicode(raw)
+        freqs = self.freqs
+        found = []
+        state = 0
+        for length, c in enumerate(raw, 1):
+            state = self._child(state, ord(c))
+            if state < 0:
+                break
+            if freqs[state]:
+                found.append((length, freqs[state]))
+        return found
+
+    def complete(self, prefix, limit=None):
+        """Words starting with the prefix, in sorted order. It returns a
+        list of ``(word, freq)``.
+
+        :param prefix: the prefix of words.
+        :param limit: maximum number of words.
+        """
+        prefix = to_unicode(prefix)
+        state = self._walk(prefix)
+        if state < 0:
+            return []
+        return list(self._iter(state, prefix, limit))
+
+    def _iter(self, state, prefix, limit=None):
+        first = self.first
+        labels = self.labels
+        freqs = self.freqs
+        count = 0
+        stack = [(state, prefix)]
+        while stack:
+            state, word = stack.pop()
+            if freqs[state]:
+                yield word, freqs[state]
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+            # reversed, so that the smallest label is visited first
+            for i in range(first[state + 1] - 1, first[state] - 1, -1):
+                stack.append((i + 1, word + unichr(labels[i])))
+
+    def search(self, raw, max_distance=1):
+        """Words within a Levenshtein distance of the password. It
+        returns a list of ``(word, freq, distance)``.
+
+        The password is walked in the trie with a budget of edits, the
+        walk is exact once the budget is spent, so small distances are
+        cheap.
+
+        :param raw: raw text password.
+        :param max_distance: maximum edit distance.
+        """
+        if max_distance <= 0:
+            freq = self.get(raw)
+            if freq is None:
+                return []
+            return [(to_unicode(raw), freq, 0)]
+
+        codes = [ord(c) for c in to_unicode(raw)]
+        n = len(codes)
+        first = self.first
+        labels = self.labels
+        freqs = self.freqs
+        best = {}
+
+        def tail(state, i, distance):
+            # an exact walk of the rest of the password
+            while i < n:
+                lo = first[state]
+                hi = first[state + 1]
+                if lo == hi:
+                    return
+                c = codes[i]
+                j = bisect_left(labels, c, lo, hi)
+                if j >= hi or labels[j] != c:
+                    return
+                state = j + 1
+                i += 1
+            if freqs[state] and best.get(state, distance + 1) > distance:
+                best[state] = distance
+
+        seen = set()
+        stack = [(0, 0, max_distance)]
+        while stack:
+            item = stack.pop()
+            if item in seen:
+                continue
+            seen.add(item)
+            state, i, budget = item
+            distance = max_distance - budget
+            if i == n and freqs[state]:
+                if best.get(state, distance + 1) > distance:
+                    best[state] = distance
+            lo = first[state]
+            hi = first[state + 1]
+            c = codes[i] if i < n else -1
+            budget -= 1
+            distance += 1
+            if budget > 0:
+                if i < n:
+                    # delete a character of the password
+                    stack.append((state, i + 1, budget))
+                for edge in range(lo, hi):
+                    if labels[edge] == c:
+                        stack.append((edge + 1, i + 1, budget + 1))
+                        continue
+                    # insert a character, or substitute one
+                    stack.append((edge + 1, i, budget))
+                    if i < n:
+                        stack.append((edge + 1, i + 1, budget))
+                continue
+
+            # the last edit, the rest is walked exactly
+            if i < n:
+                tail(state, i + 1, distance)
+            for edge in range(lo, hi):
+                if labels[edge] == c:
+                    stack.append((edge + 1, i + 1, budget + 1))
+                    continue
+                tail(edge + 1, i, distance)
+                if i < n:
+                    tail(edge + 1, i + 1, distance)
+
+        return [
+            (self._word(state), freqs[state], distance)
+            for state, distance in best.items()
+        ]
+
+    def _word(self, state):
+        """The word of a state, the parent of a state is the source of
+        its edge, which is found in the sorted first edges.
+        """
+        first = self.first
+        chars = []
+        while state:
+            chars.append(unichr(self.labels[state - 1]))
+            state = bisect_right(first, state - 1) - 1
+        return u''.join(reversed(chars))
+
+    def items(self):
+        return self._iter(0, u'')
+
+    def __iter__(self):
+        for word, _ in self.items():
+            yield word
+
+    def __len__(self):
+        if self._count is None:
+            self._count = sum(1 for f in self.freqs if f)
+        return self._count
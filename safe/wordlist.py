@@ -0,0 +1,658 @@
+# coding: utf-8
+"""
+    safe.wordlist
+
+    Compiled word list, which is queried in place from a memory map.
+
+    The compiled format is a sorted string table with an offset index,
+    a frequency column and an open addressing hash table, all integers
+    are little endian uint32::
+
+        magic   8 bytes, b'SAFEWL\\x00\\x02'
+        count   number of words, N
+        slots   number of slots of the hash table, M, a power of 2
+        offsets N + 1 offsets of words in the string table
+        freqs   N frequencies
+        hashes  N crc32 of words
+        table   M slots, index of a word plus 1, 0 is an empty slot
+        strings utf-8 encoded words, sorted by bytes
+
+    A lookup is a crc32 of the word and a linear probe of the table,
+    words are compared only when their hashes are equal.
+
+    Since nothing is parsed on loading, processes opening the same file
+    share its pages through the OS page cache.
+
+    For huge lists, e.g. breach corpora of hundreds of millions of
+    words, there is a block compressed format, see :class:`BlockWords`.
+    It is built from a ``word freq`` text file with::
+
+        $ python -m safe.wordlist breach.txt breach.idx
+
+    Any object with a ``get(word, default)`` method, just like a dict,
+    can be used as the word list of :meth:`safe.check`.
+
+    When the word list is on disk, :class:`FilteredWords` puts a Bloom
+    filter in front of it, most passwords are not common and are
+    rejected by the filter without touching the word list.
+
+    :class:`LayeredWords` adds a small overlay of words, e.g. per
+    tenant, on top of a shared word list.
+
+    :copyright: (c) 2014 by Hsiaoming Yang
+"""
+
+import os
+import sys
+import mmap
+import zlib
+import struct
+import math
+import bisect
+import threading
+from ._compat import to_unicode
+
+__all__ = [
+    'MappedWords', 'read_words', 'compile_words',
+    'BlockWords', 'build_blocks',
+    'BloomFilter', 'FilteredWords', 'LayeredWords',
+]
+
+MAGIC = b'SAFEWL\x00\x02'
+_HEADER = struct.Struct('<8sII')
+
+
+def _hash(key):
+    return zlib.crc32(key) & 0xffffffff
+
+
+def read_words(filepath):
+    """Read a ``word freq`` text file into a dict."""
+    words = {}
+    with open(filepath, 'rb') as f:
+        for line in f:
+            name, freq = line.split()
+            words[to_unicode(name.strip())] = int(freq.strip())
+    return words
+
+
+def compile_words(words, fileobj):
+    """Write a mapping of ``word -> freq`` into the compiled format.
+
+    :param words: a dict of words and their frequencies.
+    :param fileobj: a file object opened in binary mode.
+    """
+    items = sorted(
+        (word.encode('utf-8', 'surrogatepass'), freq)
+        for word, freq in words.items()
+    )
+    count = len(items)
+    # a load factor of at most 0.5, probes are short
+    slots = 2
+    while slots < count * 2:
+        slots <<= 1
+    fileobj.write(_HEADER.pack(MAGIC, count, slots))
+
+    offset = 0
+    offsets = [0]
+    for name, _ in items:
+        offset += len(name)
+        offsets.append(offset)
+    hashes = [_hash(name) for name, _ in items]
+    table = [0] * slots
+    mask = slots - 1
+    for index, h in enumerate(hashes):
+        slot = h & mask
+        while table[slot]:
+            slot = (slot + 1) & mask
+        table[slot] = index + 1
+
+    fileobj.write(struct.pack('<%dI' % (count + 1), *offsets))
+    fileobj.write(struct.pack('<%dI' % count, *[f for _, f in items]))
+    fileobj.write(struct.pack('<%dI' % count, *hashes))
+    fileobj.write(struct.pack('<%dI' % slots, *table))
+    for name, _ in items:
+        fileobj.write(name)
+
+
+def _uint_array(buf, offset, count):
+    """A view of ``count`` little endian uint32 in the buffer, it is
+    not copied when the platform allows.
+    """
+    try:
+        view = memoryview(buf)[offset:offset + count * 4]
+    except TypeError:  # pragma: no cover
+        # mmap has no new style buffer interface in Python 2
+        view = None
+    if (view is not None and sys.byteorder == 'little' and
+            hasattr(view, 'cast') and struct.calcsize('I') == 4):
+        return view.cast('I')
+    return list(struct.unpack_from('<%dI' % count, buf, offset))
+
+
+class MappedWords(object):
+    """A read only mapping of ``word -> freq`` over a buffer in the
+    compiled format. Lookups are probes of the hash table in the
+    buffer.
+
+    :param buf: a buffer of the compiled format, e.g. a mmap.
+    """
+    def __init__(self, buf):
+        if len(buf) < _HEADER.size:
+            raise ValueError('Invalid compiled words')
+        magic, count, slots = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or not slots or slots & (slots - 1):
+            raise ValueError('Invalid compiled words')
+        strings = _HEADER.size + (count * 3 + 1 + slots) * 4
+        if len(buf) < strings:
+            raise ValueError('Truncated compiled words')
+        self._buf = buf
+        self._count = count
+        offset = _HEADER.size
+        self._offsets = _uint_array(buf, offset, count + 1)
+        offset += (count + 1) * 4
+        self._freqs = _uint_array(buf, offset, count)
+        offset += count * 4
+        self._hashes = _uint_array(buf, offset, count)
+        offset += count * 4
+        self._table = _uint_array(buf, offset, slots)
+        self._mask = slots - 1
+        self._strings = strings
+        if len(buf) < strings + self._offsets[count]:
+            raise ValueError('Truncated compiled words')
+
+    @classmethod
+    def open(cls, filename):
+        """Map a compiled file into memory."""
+        with open(filename, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buf)
+
+    def _word(self, index):
+        start = self._strings + self._offsets[index]
+        end = self._strings + self._offsets[index + 1]
+        return self._buf[start:end]
+
+    def _find(self, word):
+        key = word.encode('utf-8', 'surrogatepass')
+        h = zlib.crc32(key) & 0xffffffff
+        table = self._table
+        hashes = self._hashes
+        mask = self._mask
+        slot = h & mask
+        while True:
+            index = table[slot]
+            if not index:
+                return -1
+            index -= 1
+            if hashes[index] == h and self._word(index) == key:
+                return index
+            slot = (slot + 1) & mask
+
+    def get(self, word, default=None):
+        index = self._find(to_unicode(word))
+        if index < 0:
+            return default
+        return self._freqs[index]
+
+    def items(self):
+        for index in range(self._count):
+            freq = self._freqs[index]
+            word = self._word(index).decode('utf-8', 'surrogatepass')
+            yield word, freq
+
+    def __contains__(self, word):
+        return self._find(to_unicode(word)) >= 0
+
+    def __iter__(self):
+        for word, _ in self.items():
+            yield word
+
+    def __len__(self):
+        return self._count
+
+
+BLOCK_MAGIC = b'SAFEBK\x00\x01'
+# index offset, index length, block count, word count, magic
+_FOOTER = struct.Struct('<QQIQ8s')
+# block offset, block length, first word length
+_ENTRY = struct.Struct('<QIH')
+
+
+def _sorted_runs(lines, chunk_size):
+    """Sort ``(word, freq)`` pairs in chunks, spill every chunk into a
+    temporary file, and merge them back in order. Memory is bounded by
+    ``chunk_size`` pairs.
+    """
+    runs = []
+    try:
+        chunk = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            name, freq = line.split()
+            chunk.append((name, int(freq)))
+            if len(chunk) >= chunk_size:
+                runs.append(_spill(chunk))
+                chunk = []
+        if chunk:
+            runs.append(_spill(chunk))
+        import heapq
+        for item in heapq.merge(*[_read_run(f) for f in runs]):
+            yield item
+    finally:
+        for f in runs:
+            f.close()
+
+
+def _spill(chunk):
+    import tempfile
+    chunk.sort()
+    f = tempfile.TemporaryFile()
+    for name, freq in chunk:
+        f.write(name + b' ' + str(freq).encode('ascii') + b'\n')
+    f.seek(0)
+    return f
+
+
+def _read_run(f):
+    for line in f:
+        name, freq = line.split()
+        yield name, int(freq)
+
+
+def build_blocks(source, dest, block_size=4096, chunk_size=1000000):
+    """Build a block compressed word list from a ``word freq`` text file.
+    The source doesn't need to be sorted, it is sorted externally with
+    at most ``chunk_size`` words in memory. Duplicated words keep the
+    highest frequency.
+
+    :param source: path of the ``word freq`` text file.
+    :param dest: path of the block compressed file.
+    :param block_size: uncompressed size of every block.
+    :param chunk_size: words in memory when sorting.
+    """
+    entries = []
+    count = 0
+    with open(source, 'rb') as src, open(dest, 'wb') as f:
+        f.write(BLOCK_MAGIC)
+
+        block = []
+        size = 0
+        last = None
+
+        def flush():
+            data = zlib.compress(b''.join(block))
+            first = block[0].split(b'\t', 1)[0]
+            entries.append((f.tell(), len(data), first))
+            f.write(data)
+
+        for name, freq in _sorted_runs(src, chunk_size):
+            if name == last:
+                # merged runs are sorted by (word, freq), the last one
+                # of duplicated words has the highest frequency
+                block[-1] = name + b'\t' + str(freq).encode('ascii') + b'\n'
+                continue
+            if size >= block_size:
+                flush()
+                block = []
+                size = 0
+            line = name + b'\t' + str(freq).encode('ascii') + b'\n'
+            block.append(line)
+            size += len(line)
+            last = name
+            count += 1
+        if block:
+            flush()
+
+        index_offset = f.tell()
+        for offset, length, first in entries:
+            f.write(_ENTRY.pack(offset, length, len(first)))
+            f.write(first)
+        index_length = f.tell() - index_offset
+        f.write(_FOOTER.pack(
+            index_offset, index_length, len(entries), count, BLOCK_MAGIC
+        ))
+
+
+class BlockWords(object):
+    """A read only mapping of ``word -> freq`` over a block compressed
+    file built by :meth:`build_blocks`. Only the first word of every
+    block is kept in memory, a lookup is a binary search over them and
+    one block read from the file.
+
+    :param filename: path of the block compressed file.
+    :param cache_blocks: number of decompressed blocks kept in memory.
+    """
+    def __init__(self, filename, cache_blocks=64):
+        self._file = open(filename, 'rb')
+        self._lock = threading.Lock()
+        self._file.seek(-_FOOTER.size, os.SEEK_END)
+        footer = self._file.read(_FOOTER.size)
+        if len(footer) != _FOOTER.size:
+            raise ValueError('Invalid block words')
+        (index_offset, index_length, blocks,
+         self._count, magic) = _FOOTER.unpack(footer)
+        if magic != BLOCK_MAGIC:
+            raise ValueError('Invalid block words')
+
+        self._file.seek(index_offset)
+        index = self._file.read(index_length)
+        self._firsts = []
+        self._blocks = []
+        pos = 0
+        for _ in range(blocks):
+            offset, length, size = _ENTRY.unpack_from(index, pos)
+            pos += _ENTRY.size
+            self._firsts.append(index[pos:pos + size])
+            self._blocks.append((offset, length))
+            pos += size
+
+        self._cache = {}
+        self._cache_blocks = cache_blocks
+
+    def close(self):
+        self._file.close()
+
+    def _read_block(self, index):
+        block = self._cache.get(index)
+        if block is not None:
+            return block
+        offset, length = self._blocks[index]
+        with self._lock:
+            self._file.seek(offset)
+            data = self._file.read(length)
+        lines = zlib.decompress(data).splitlines()
+        block = ([], [])
+        for line in lines:
+            name, freq = line.split(b'\t')
+            block[0].append(name)
+            block[1].append(int(freq))
+        if len(self._cache) >= self._cache_blocks:
+            self._cache.clear()
+        self._cache[index] = block
+        return block
+
+    def get(self, word, default=None):
+        key = to_unicode(word).encode('utf-8', 'surrogatepass')
+        index = bisect.bisect_right(self._firsts, key) - 1
+        if index < 0:
+            return default
+        names, freqs = self._read_block(index)
+        i = bisect.bisect_left(names, key)
+        if i < len(names) and names[i] == key:
+            return freqs[i]
+        return default
+
+    def items(self):
+        for index in range(len(self._blocks)):
+            names, freqs = self._read_block(index)
+            for name, freq in zip(names, freqs):
+                yield name.decode('utf-8', 'surrogatepass'), freq
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __iter__(self):
+        for word, _ in self.items():
+            yield word
+
+    def __len__(self):
+        return self._count
+
+
+BLOOM_MAGIC = b'SAFEBF\x00\x02'
+# magic, size in bits, number of hashes, number of words, key of words
+_BLOOM_HEADER = struct.Struct('<8sQIQ20s')
+
+
+class BloomFilter(object):
+    """A Bloom filter of words. A word not in the filter is never in
+    the word list, a word in the filter is in the word list with a
+    probability of ``1 - error_rate``.
+
+    :param size: size of the filter in bits.
+    :param hashes: number of hash functions.
+    :param bits: the bit array, a bytearray or any buffer.
+    :param count: number of words of the filter.
+    :param key: a key of the source of words, up to 20 bytes.
+    """
+    def __init__(self, size, hashes, bits=None, count=0, key=b''):
+        if bits is None:
+            bits = bytearray((size + 7) // 8)
+        self.size = size
+        self.hashes = hashes
+        self.bits = bits
+        self.count = count
+        self.key = key
+        import hashlib
+        self._sha1 = hashlib.sha1
+
+    @classmethod
+    def create(cls, count, error_rate=0.01, size=None, key=b''):
+        """Create an empty filter for ``count`` words.
+
+        :param count: number of words to add.
+        :param error_rate: the expected false positive rate.
+        :param size: size of the filter in bits, computed from the
+                     ``error_rate`` by default.
+        :param key: a key of the source of words.
+        """
+        n = max(count, 1)
+        if size is None:
+            size = int(-n * math.log(error_rate) / math.log(2) ** 2)
+        size = max(size, 8)
+        hashes = max(1, int(round(size / float(n) * math.log(2))))
+        return cls(size, hashes, count=count, key=key)
+
+    @classmethod
+    def load(cls, filename):
+        """Map a saved filter into memory."""
+        with open(filename, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(buf) < _BLOOM_HEADER.size:
+            raise ValueError('Invalid bloom filter')
+        magic, size, hashes, count, key = _BLOOM_HEADER.unpack_from(buf, 0)
+        if magic != BLOOM_MAGIC:
+            raise ValueError('Invalid bloom filter')
+        bits = memoryview(buf)[_BLOOM_HEADER.size:]
+        if len(bits) < (size + 7) // 8:
+            raise ValueError('Truncated bloom filter')
+        return cls(size, hashes, bits, count, key.rstrip(b'\0'))
+
+    def save(self, fileobj):
+        """Write the filter into a file object opened in binary mode."""
+        fileobj.write(_BLOOM_HEADER.pack(
+            BLOOM_MAGIC, self.size, self.hashes, self.count, self.key,
+        ))
+        fileobj.write(bytes(self.bits))
+
+    def _positions(self, word):
+        key = to_unicode(word).encode('utf-8', 'surrogatepass')
+        h1, h2 = struct.unpack('<QQ', self._sha1(key).digest()[:16])
+        size = self.size
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % size
+
+    def add(self, word):
+        bits = self.bits
+        for pos in self._positions(word):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, word):
+        bits = self.bits
+        for pos in self._positions(word):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class FilteredWords(object):
+    """A word list with a :class:`BloomFilter` in front of it. Only words
+    in the filter are looked up in the word list.
+
+    :param words: the exact word list.
+    :param bloom: a :class:`BloomFilter` built from the word list.
+    """
+    def __init__(self, words, bloom):
+        self.words = words
+        self.bloom = bloom
+
+    @classmethod
+    def open(cls, words, filename=None, error_rate=0.01, size=None,
+             key=b''):
+        """Load the filter of ``words`` from ``filename``, the filter is
+        built and saved into ``filename`` if it doesn't exist, or if it
+        was built from another word list, that is, another number of
+        words or another ``key``.
+
+        :param words: the exact word list, it must be iterable to build
+                      the filter.
+        :param filename: path of the filter file, nothing is saved if it
+                         is ``None``.
+        :param error_rate: the expected false positive rate.
+        :param size: size of the filter in bits.
+        :param key: a key of the source of words, e.g.
+                    :meth:`safe.cache.source_key` of the words file, so
+                    that a filter of a modified word list of the same
+                    size is rebuilt.
+        """
+        if filename and os.path.exists(filename):
+            try:
+                bloom = BloomFilter.load(filename)
+            except ValueError:
+                bloom = None
+            if bloom is not None and (
+                    bloom.count == len(words) and bloom.key == key):
+                return cls(words, bloom)
+
+        bloom = BloomFilter.create(len(words), error_rate, size, key)
+        for word in words:
+            bloom.add(word)
+        if filename:
+            # replace the file instead of truncating it, the old filter
+            # may still be mapped
+            import tempfile
+            dirname = os.path.dirname(os.path.abspath(filename))
+            fd, tmp = tempfile.mkstemp(dir=dirname)
+            with os.fdopen(fd, 'wb') as f:
+                bloom.save(f)
+            if hasattr(os, 'replace'):
+                os.replace(tmp, filename)
+            else:  # pragma: no cover
+                os.rename(tmp, filename)
+        return cls(words, bloom)
+
+    def get(self, word, default=None):
+        if word not in self.bloom:
+            return default
+        return self.words.get(word, default)
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+
+#: frequency of overlay words without a frequency, they are always common
+OVERLAY_FREQ = 1 << 30
+
+
+class LayeredWords(object):
+    """A word list of a shared base and a small overlay, e.g. the banned
+    words of a tenant on top of the common words. The base is shared by
+    all overlays, memory only grows with the overlay words::
+
+        >>> base = MappedWords.open('words.cache')
+        >>> tenants = {
+        ...     'acme': LayeredWords(['acme', 'roadrunner'], base),
+        ...     'initech': LayeredWords({'tps-report': 10}, base),
+        ... }
+        >>> safe.check('roadrunner', words=tenants['acme'])
+        simple
+
+    An overlay word with a zero frequency is removed from the base. A
+    lookup probes the overlay and then the base, at most two probes.
+
+    :param overlay: a mapping of ``word -> freq``, or an iterable of
+                    words with a frequency of :data:`OVERLAY_FREQ`.
+    :param base: the shared word list, the bundled words by default,
+                 which follow :meth:`safe.reload`.
+    """
+    def __init__(self, overlay=(), base=None):
+        if hasattr(overlay, 'items'):
+            items = overlay.items()
+        else:
+            items = ((word, OVERLAY_FREQ) for word in overlay)
+        self.overlay = dict((to_unicode(w), freq) for w, freq in items)
+        self.base = base
+
+    def _base(self):
+        if self.base is not None:
+            return self.base
+        from . import _wordlist
+        return _wordlist.get()
+
+    def get(self, word, default=None):
+        word = to_unicode(word)
+        freq = self.overlay.get(word)
+        if freq is None:
+            return self._base().get(word, default)
+        return freq or default
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def items(self):
+        overlay = self.overlay
+        for word, freq in self._base().items():
+            if word not in overlay:
+                yield word, freq
+        for word, freq in overlay.items():
+            if freq:
+                yield word, freq
+
+    def __iter__(self):
+        for word, _ in self.items():
+            yield word
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='python -m safe.wordlist',
+        description='Build a block compressed word list.',
+    )
+    parser.add_argument('source', help='a "word freq" text file')
+    parser.add_argument('dest', help='the output file')
+    parser.add_argument(
+        '--block-size', type=int, default=4096,
+        help='uncompressed size of every block',
+    )
+    parser.add_argument(
+        '--chunk-size', type=int, default=1000000,
+        help='words in memory when sorting',
+    )
+    parser.add_argument(
+        '--bloom', type=float, metavar='ERROR_RATE',
+        help='also build a bloom filter into DEST.bloom',
+    )
+    args = parser.parse_args(argv)
+    build_blocks(
+        args.source, args.dest,
+        block_size=args.block_size, chunk_size=args.chunk_size,
+    )
+    if args.bloom:
+        filename = args.dest + '.bloom'
+        if os.path.exists(filename):
+            os.remove(filename)
+        FilteredWords.open(BlockWords(args.dest), filename, args.bloom)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -37,6 +37,9 @@ setup(
     long_description=fread('README.rst'),
     license='BSD',
     install_requires=[],
+    entry_points={
+        'console_scripts': ['safe-audit = safe.__main__:main'],
+    },
     tests_require=['nose'],
     test_suite='nose.collector',
     classifiers=[
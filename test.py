@@ -1,8 +1,10 @@
 # coding: utf-8
 import os
+import sys
 import tempfile
 
 import safe
+from safe import wordlist
 
 
 def test_asdf():
@@ -60,11 +62,800 @@ def test_no_cache_on_safe_check():
     assert not os.path.exists(cache_file)
 
 def _clear_cache_file():
-    filename = 'safe-%s.words.cache' % safe.__version__
-    _cache_file = os.environ.get(
-        'PYTHON_SAFE_WORDS_CACHE',
-        os.path.join(tempfile.gettempdir(), filename),
-    )
+    _cache_file = safe._cache_path()
     if os.path.exists(_cache_file):
         os.remove(_cache_file)
     return _cache_file
+
+
+def test_check_many():
+    passwords = ['1', 'password', 'yhnolku', 'yhnolkuT', 'yhnolkuT.']
+    batch = safe.check_many(passwords, length=7)
+    assert len(batch) == 5
+    assert list(batch.valid) == [0, 0, 0, 0, 1]
+    assert list(batch.levels) == [
+        safe.TERRIBLE, safe.SIMPLE, safe.SIMPLE, safe.MEDIUM, safe.STRONG
+    ]
+    for raw, strength in zip(passwords, batch):
+        expected = safe.check(raw, length=7)
+        assert bool(strength) == bool(expected)
+        assert repr(strength) == repr(expected)
+        assert str(strength) == str(expected)
+
+
+def test_check_many_level():
+    batch = safe.check_many(['yhnolkuT', 'yhnolkuT'], level=safe.MEDIUM)
+    assert list(batch.valid) == [1, 1]
+    assert list(batch.messages) == [safe.NOT_STRONG, safe.NOT_STRONG]
+
+
+def test_compiled_words():
+    words = {u'password': 32027, u'123456': 25969, u'passé': 3}
+    filepath = os.path.join(tempfile.mkdtemp(), 'words.cache')
+    with open(filepath, 'wb') as f:
+        wordlist.compile_words(words, f)
+    mapped = wordlist.MappedWords.open(filepath)
+    assert len(mapped) == 3
+    assert mapped.get(u'password') == 32027
+    assert mapped.get(u'passé') == 3
+    assert mapped.get(u'pass', 0) == 0
+    assert u'123456' in mapped
+    assert dict(mapped.items()) == words
+
+    # probes of a full hash table
+    words = dict((u'word%d' % i, i + 1) for i in range(3000))
+    mapped = wordlist.MappedWords(_compiled(words))
+    assert all(mapped.get(word) == freq for word, freq in words.items())
+    assert not [i for i in range(3000, 6000) if u'word%d' % i in mapped]
+    assert wordlist.MappedWords(_compiled({})).get(u'password') is None
+
+
+def _compiled(words):
+    import io
+    f = io.BytesIO()
+    wordlist.compile_words(words, f)
+    return f.getvalue()
+
+
+def test_cache_on_load_words():
+    cache_file = _clear_cache_file()
+    words = safe._load_words()
+    assert isinstance(words, wordlist.MappedWords)
+    assert os.path.exists(cache_file)
+    assert dict(words.items()) == safe._load_words(cache_words=False)
+
+
+def _update_environ(values):
+    """Set environment variables, a value of ``None`` removes it. It
+    returns the old values to restore them.
+    """
+    old = {}
+    for name, value in values.items():
+        old[name] = os.environ.get(name)
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    return old
+
+
+def test_cache_key():
+    dirname = tempfile.mkdtemp()
+    source = os.path.join(dirname, 'words.txt')
+    with open(source, 'w') as f:
+        f.write('password 100\n')
+    environ = _update_environ({
+        'PYTHON_SAFE_WORDS_FILE': source,
+        'PYTHON_SAFE_WORDS_CACHE': os.path.join(dirname, 'words.cache'),
+    })
+    try:
+        assert safe._load_words().get('password') == 100
+
+        # a modified source is not read from the stale cache
+        with open(source, 'w') as f:
+            f.write('password 100\ndragon 50\n')
+        os.utime(source, (1, 1))
+        assert safe._load_words().get('dragon') == 50
+
+        # a corrupted cache is rebuilt
+        with open(safe._cache_path(), 'r+b') as f:
+            f.seek(-4, 2)
+            f.write(b'\0\0\0\0')
+        assert safe._load_words().get('dragon') == 50
+    finally:
+        _update_environ(environ)
+
+    names = os.listdir(dirname)
+    assert not [name for name in names if name.startswith('.')]
+
+    # words files have default cache files of their own
+    environ = _update_environ({
+        'PYTHON_SAFE_WORDS_FILE': None, 'PYTHON_SAFE_WORDS_CACHE': None,
+    })
+    try:
+        default = safe._cache_path()
+        os.environ['PYTHON_SAFE_WORDS_FILE'] = source
+        assert safe._cache_path() != default
+        assert os.path.dirname(safe._cache_path()) == (
+            os.path.dirname(default)
+        )
+    finally:
+        _update_environ(environ)
+
+
+def test_cache_fallback():
+    from safe import cache, metrics
+
+    # a cache file which can not be written, e.g. in a directory of
+    # another user
+    filename = os.path.join(tempfile.mkdtemp(), 'missing', 'words.cache')
+    stats = metrics.Stats()
+    metrics.set_recorder(stats)
+    try:
+        value = cache.load(
+            'words', filename, b'k' * 20, wordlist.MappedWords,
+            lambda: ({'password': 100}, None),
+        )
+    finally:
+        metrics.set_recorder(None)
+    assert value == {'password': 100}
+    assert stats.counters['cache.words.error'] == 1
+
+    environ = _update_environ({'PYTHON_SAFE_WORDS_CACHE': filename})
+    holders = safe._wordlist, safe._automaton
+    safe._wordlist = safe._Lazy(safe._load_words, 'words')
+    safe._automaton = safe._Lazy(safe._load_automaton, 'automaton')
+    try:
+        assert safe.check('x*V-92Ba').message == 'password is perfect'
+        assert not safe.check('password')
+    finally:
+        _update_environ(environ)
+        safe._wordlist, safe._automaton = holders
+    assert not os.path.exists(os.path.dirname(filename))
+
+    # the default cache file is per user
+    if hasattr(os, 'getuid') and not environ['PYTHON_SAFE_WORDS_CACHE']:
+        assert str(os.getuid()) in os.path.basename(safe._cache_path())
+
+
+def test_block_words():
+    dirname = tempfile.mkdtemp()
+    source = os.path.join(dirname, 'breach.txt')
+    dest = os.path.join(dirname, 'breach.idx')
+    with open(source, 'wb') as f:
+        for i in range(5000, 0, -1):
+            f.write(('word%d %d\n' % (i, i)).encode('ascii'))
+        f.write(b'word42 99\nmonkeydragon 7\n')
+    wordlist.build_blocks(source, dest, block_size=256, chunk_size=1000)
+    words = wordlist.BlockWords(dest)
+    assert len(words) == 5001
+    assert words.get(u'word1') == 1
+    assert words.get(u'word5000') == 5000
+    assert words.get(u'word42') == 99
+    assert words.get(u'aaaa', 0) == 0
+    assert words.get(u'zzzz', 0) == 0
+    assert safe.is_common_password('monkeydragon', words=words)
+    assert not safe.is_common_password('password', words=words)
+    s = safe.check('monkeydragon', words=words)
+    assert 'common' in s.message
+    words.close()
+
+
+def test_bloom_filter():
+    words = safe._load_words(cache_words=False)
+    filename = os.path.join(tempfile.mkdtemp(), 'words.bloom')
+    filtered = wordlist.FilteredWords.open(words, filename, error_rate=0.01)
+    assert os.path.exists(filename)
+    assert all(word in filtered.bloom for word in words)
+
+    misses = sum(1 for i in range(10000) if 'x%dx' % i in filtered.bloom)
+    assert misses < 300
+
+    loaded = wordlist.FilteredWords.open(words, filename)
+    assert loaded.bloom.size == filtered.bloom.size
+    assert loaded.get(u'password') == 32027
+    assert loaded.get(u'yhnolkuT.', 0) == 0
+    assert safe.check('password', words=loaded).message == (
+        'password is too common'
+    )
+
+    # a filter of another word list is rebuilt
+    words = dict(words)
+    words[u'zkwpqjxmv'] = 5
+    rebuilt = wordlist.FilteredWords.open(words, filename)
+    assert rebuilt.get(u'zkwpqjxmv') == 5
+    del words[u'password']
+    rebuilt = wordlist.FilteredWords.open(words, filename, key=b'v2')
+    assert rebuilt.bloom.key == b'v2'
+    assert wordlist.BloomFilter.load(filename).key == b'v2'
+    assert wordlist.FilteredWords.open(words, filename, key=b'v2').bloom.key
+
+
+def test_preload():
+    import threading
+
+    holder = safe._wordlist
+    calls = []
+
+    def _load(cache_words=True):
+        calls.append(cache_words)
+        return safe._load_words(cache_words)
+
+    safe._wordlist = safe._Lazy(_load)
+    try:
+        threads = [threading.Thread(target=safe.preload) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        info = safe.preload()
+    finally:
+        safe._wordlist = holder
+    assert len(calls) == 1
+    assert info['count'] == 10000
+    assert info['seconds'] >= 0
+
+
+def test_char_types():
+    assert safe.char_types('') == 0
+    assert safe.char_types('abc') == safe.TYPE_LOWER
+    assert safe.char_types('aB3') == (
+        safe.TYPE_LOWER | safe.TYPE_UPPER | safe.TYPE_NUMBER
+    )
+    assert safe.char_types(u'密码 1') == safe.TYPE_MARKS | safe.TYPE_NUMBER
+    assert safe.count_types(u'yhnolkuT.!') == (7, 1, 0, 2)
+    assert safe.count_types(u'Ab1密') == (1, 1, 1, 1)
+
+
+def test_metrics():
+    from safe import metrics
+
+    stats = metrics.Stats()
+    holder = safe._wordlist
+    safe._wordlist = safe._Lazy(safe._load_words, 'words')
+    metrics.set_recorder(stats)
+    try:
+        safe.check('password')
+        safe.check('x*V-92Ba')
+        safe.check('abc')
+    finally:
+        metrics.set_recorder(None)
+        safe._wordlist = holder
+
+    counters = stats.counters
+    assert counters['check.message.too_common'] == 1
+    assert counters['check.message.perfect'] == 1
+    assert counters['check.message.too_short'] == 1
+    assert counters['check.level.simple'] == 1
+    assert counters['check.level.strong'] == 1
+    assert counters['check.level.terrible'] == 1
+    assert 'cache.words.hit' in counters or 'cache.words.miss' in counters
+    assert stats.timings['load.words']['count'] == 1
+    assert stats.timings['stage.common']['count'] == 2
+    assert stats.timings['stage.types']['count'] == 1
+
+    # nothing is recorded when disabled
+    safe.check('password')
+    assert counters['check.message.too_common'] == 1
+
+
+def test_shared_words():
+    # multiprocessing.shared_memory is new in Python 3.8
+    if sys.version_info < (3, 8):
+        return
+    import pickle
+    import subprocess
+    from safe.shared import SharedWords
+
+    shared = SharedWords.create({'password': 100, u'密码': 5})
+    try:
+        words = SharedWords.attach(shared.name)
+        assert words.get('password') == 100
+        assert words.get(u'密码') == 5
+        assert not safe.check('password', words=words)
+        words.close()
+
+        words = pickle.loads(pickle.dumps(shared))
+        assert words.get('missing', 0) == 0
+        words.close()
+
+        # workers attach to the block by the environment variable
+        env = dict(os.environ, PYTHON_SAFE_WORDS_SHM=shared.name)
+        env['PYTHONPATH'] = os.path.dirname(os.path.abspath(__file__))
+        cache_file = os.path.join(tempfile.mkdtemp(), 'words.cache')
+        env['PYTHON_SAFE_WORDS_CACHE'] = cache_file
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import safe; safe.preload(); '
+            'print(safe.is_common_password(u"password"))',
+        ], env=env)
+        assert output.strip() == b'True'
+        # the automaton of the shared words is not cached as the
+        # automaton of the words file
+        assert os.path.exists(cache_file + '.ac.shm')
+        assert not os.path.exists(cache_file + '.ac')
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+def test_verdict_cache():
+    cache = safe.VerdictCache(size=2)
+    assert repr(safe.check('password', cache=cache)) == 'simple'
+    assert repr(safe.check('password', cache=cache)) == 'simple'
+    # the policy is a part of the key
+    assert safe.check('password', length=10, cache=cache).message == (
+        'password is too short'
+    )
+    assert cache.stats() == {
+        'size': 2, 'hits': 1, 'misses': 2, 'evictions': 0,
+    }
+
+    policy = safe.Policy(cache=cache)
+    assert repr(policy('x*V-92Ba')) == 'strong'
+    assert cache.stats()['evictions'] == 1
+    assert list(policy.check_many(['x*V-92Ba', 'password']).valid) == [1, 0]
+    assert cache.hits == 2
+    # passwords are not kept in memory
+    assert not [key for key in cache._items if 'password' in repr(key)]
+
+    cache = safe.VerdictCache(ttl=0)
+    policy = safe.Policy(cache=cache)
+    policy('password')
+    policy('password')
+    assert cache.hits == 0
+
+    # backends built per call never share verdicts, even if the id of
+    # a freed backend is reused
+    cache = safe.VerdictCache()
+    base = {u'password': 100}
+    for i in range(20):
+        overlay = ['acmecorp9X!'] if i % 2 else []
+        words = wordlist.LayeredWords(overlay, base)
+        s = safe.check('acmecorp9X!', words=words, cache=cache)
+        del words
+        assert bool(s) == (not overlay)
+
+
+def test_import_time():
+    import subprocess
+
+    if sys.version_info < (3, 7):
+        # -X importtime is new in Python 3.7
+        return
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.abspath(__file__))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    # the first run compiles the modules, the second one is measured
+    subprocess.check_call([sys.executable, '-c', 'import safe'], env=env)
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import safe'],
+        env=env, stderr=subprocess.STDOUT,
+    ).decode('utf-8')
+    modules = {}
+    for line in output.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    # cumulative time in microseconds, the standard library included
+    assert modules['safe'] < 30000
+    # heavy modules are loaded on first use
+    heavy = set([
+        'asyncio', 're', 'logging', 'tempfile', 'hashlib', 'hmac',
+        'pickle', 'multiprocessing', 'safe.scoring', 'safe.aio',
+    ])
+    assert not heavy.intersection(modules)
+
+    assert safe.LOWER.match('a')
+    assert safe.aio.acheck is safe.acheck
+    assert 'acheck' in safe.__all__
+
+
+def test_incremental_checker():
+    import random
+
+    checker = safe.IncrementalChecker()
+    assert repr(checker.append('passw')) == 'terrible'
+    assert checker.append('ord').message == 'password is too common'
+    assert checker.delete(4).message == 'password is too short'
+    assert repr(checker.append('!zV9Q')) == 'strong'
+    assert repr(checker.update('x*V-92Ba')) == 'strong'
+    assert checker.text == 'x*V-92Ba'
+
+    # every edit has the same verdict as the policy
+    rnd = random.Random(1)
+    pieces = ['password', 'dragon', 'qwer', '1qaz2wsx', 'abcd', 'P@ss',
+              'W0rd', '2024', '!', '*V-', '7896321', 'lkjh']
+    ratio = safe.WORD_RATIO
+    for options in [
+            {}, {'word_ratio': ratio}, {'word_ratio': ratio, 'leet': False},
+            {'word_ratio': ratio, 'max_length': 10}]:
+        policy = safe.Policy(**options)
+        checker = safe.IncrementalChecker(policy)
+        for _ in range(500):
+            if rnd.random() < 0.7 and len(checker) < 30:
+                checker.append(rnd.choice(pieces)[:rnd.randint(1, 4)])
+            else:
+                checker.delete(rnd.randint(1, 3))
+            assert checker.verdict() is policy(checker.text)
+
+
+def test_range_words():
+    import threading
+    from safe import ranges
+
+    dirname = tempfile.mkdtemp()
+    ranges.build_ranges(
+        {'password': 100, 'dragon': 50, u'密码': 5}, dirname,
+        prefix_length=1,
+    )
+    server = ranges.serve(dirname, port=0)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d/range/' % server.server_address[1]
+    try:
+        words = ranges.RangeWords(url, prefix_length=1)
+        assert words.get('password') == 100
+        assert words.get(u'密码') == 5
+        assert words.get('x*V-92Ba', 0) == 0
+        assert not safe.check('password', words=words)
+        assert words.get_many(['dragon', 'missing']) == [50, None]
+
+        # cached prefixes are not requested again
+        requests = words.requests
+        assert words.get('password') == 100
+        assert words.requests == requests
+
+        # concurrent lookups of a prefix share a request
+        words = ranges.RangeWords(url, prefix_length=1)
+        threads = [
+            threading.Thread(target=words.get, args=('password',))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert words.requests == 1
+        words.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # connections are closed when the retry fails as well
+    import socket
+
+    class Connection(object):
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    def fail(conn, prefix):
+        raise socket.error('reset')
+
+    words = ranges.RangeWords('http://127.0.0.1:9/range/')
+    kept = Connection()
+    words._pool.put(kept)
+    fresh = []
+    words._connect = lambda: fresh.append(Connection()) or fresh[-1]
+    words._request = fail
+    try:
+        words.get('password')
+    except socket.error:
+        pass
+    else:
+        raise AssertionError('socket.error is not raised')
+    assert kept.closed
+    assert len(fresh) == 1 and fresh[0].closed
+
+
+def test_reload():
+    import threading
+
+    dirname = tempfile.mkdtemp()
+    source = os.path.join(dirname, 'words.txt')
+    with open(source, 'w') as f:
+        f.write('password 100\n')
+    environ = _update_environ({
+        'PYTHON_SAFE_WORDS_FILE': source,
+        'PYTHON_SAFE_WORDS_CACHE': os.path.join(dirname, 'words.cache'),
+    })
+    holders = safe._wordlist, safe._automaton, safe._trie
+    safe._wordlist = safe._Lazy(safe._load_words)
+    safe._automaton = safe._Lazy(safe._load_automaton)
+    safe._trie = safe._Lazy(safe._load_trie)
+
+    cache = safe.VerdictCache()
+
+    def is_common():
+        strength = safe.check('zkwpqjxmv', cache=cache)
+        return strength.message == 'password is too common'
+
+    try:
+        assert not is_common()
+        old = safe._wordlist.value
+
+        with open(source, 'w') as f:
+            f.write('password 100\nzkwpqjxmv 5\n')
+        os.utime(source, (1, 1))
+        info = safe.reload()
+        assert info['count'] == 2
+        assert info['delta'] == 1
+        assert safe._wordlist.value is not old
+        # cached verdicts of the old words are not used
+        assert is_common()
+        # the old words are still usable by running checks
+        assert old.get('password') == 100
+
+        reloaded = threading.Event()
+        watcher = safe.watch(
+            interval=0.01, callback=lambda info: reloaded.set()
+        )
+        try:
+            with open(source, 'w') as f:
+                f.write('password 100\n')
+            os.utime(source, (2, 2))
+            assert reloaded.wait(5)
+        finally:
+            watcher.stop()
+        assert not is_common()
+    finally:
+        _update_environ(environ)
+        safe._wordlist, safe._automaton, safe._trie = holders
+
+
+def test_layered_words():
+    base = {u'password': 100, u'dragon': 50}
+    acme = wordlist.LayeredWords(['acmecorp', 'roadrunner'], base)
+    initech = wordlist.LayeredWords({u'tpsreport': 10, u'dragon': 0}, base)
+    assert acme.base is initech.base
+
+    assert acme.get('password') == 100
+    assert acme.get('acmecorp') == wordlist.OVERLAY_FREQ
+    assert initech.get('acmecorp') is None
+    assert initech.get('tpsreport') == 10
+    # removed from the base in the overlay
+    assert acme.get('dragon') == 50
+    assert initech.get('dragon', 0) == 0
+    assert dict(initech.items()) == {u'password': 100, u'tpsreport': 10}
+
+    assert not safe.check('roadrunner', words=acme, freq=1000)
+    assert safe.is_common_password('roadrunner', words=acme)
+    assert not safe.is_common_password('roadrunner', words=initech)
+
+    # the bundled words by default
+    words = wordlist.LayeredWords(['acmecorp'])
+    assert words.get('password') == safe._wordlist.get().get('password')
+
+
+def test_trie():
+    import io
+    from safe.trie import Trie
+
+    words = {u'pass': 10, u'password': 100, u'passwd': 20, u'dragon': 5}
+    f = io.BytesIO()
+    Trie.build(words).save(f)
+    trie = Trie.from_buffer(f.getvalue())
+    assert len(trie) == 4
+    assert dict(trie.items()) == words
+    assert trie.get('passwd') == 20
+    assert 'passw' not in trie
+    assert trie.prefixes('password123') == [(4, 10), (8, 100)]
+    assert trie.complete('passw') == [(u'passwd', 20), (u'password', 100)]
+    assert trie.complete('passw', limit=1) == [(u'passwd', 20)]
+    assert sorted(trie.search('passwrd')) == [
+        (u'passwd', 20, 1), (u'password', 100, 1),
+    ]
+    assert trie.search('dargon') == []
+    assert trie.search('passwrd', 0) == []
+    assert trie.search('passwd', 0) == [(u'passwd', 20, 0)]
+    assert trie.search('dargon', 2) == [(u'dragon', 5, 2)]
+
+    assert safe.check('12qwasz!')
+    s = safe.check('12qwasz!', distance=1)
+    assert not s and 'common' in s.message
+    checker = safe.IncrementalChecker(distance=1)
+    assert not checker.append('12qwasz!')
+    assert safe.Policy(distance=10).distance == safe.MAX_DISTANCE
+    assert safe.Policy(distance=1).distance == 1
+
+
+def test_acheck():
+    if sys.version_info < (3, 5):
+        return
+    import asyncio
+
+    holder = safe._wordlist
+    safe._wordlist = safe._Lazy(safe._load_words)
+    safe.aio._wordlist = safe._wordlist
+    loop = asyncio.new_event_loop()
+    try:
+        tasks = [loop.create_task(safe.apreload()) for _ in range(8)]
+        loop.run_until_complete(asyncio.wait(tasks))
+        assert all(task.result()['count'] == 10000 for task in tasks)
+        s = loop.run_until_complete(safe.acheck('password'))
+        assert 'common' in s.message
+        batch = loop.run_until_complete(
+            safe.acheck_many(['password', 'yhnolkuT.'])
+        )
+        assert list(batch.valid) == [0, 1]
+        s = loop.run_until_complete(safe.acheck(
+            u'yhnolkuT.' * 10, max_length=20, truncate=False
+        ))
+        assert 'long' in s.message
+        s = loop.run_until_complete(safe.acheck('12qwasz!', distance=1))
+        assert 'common' in s.message
+        batch = loop.run_until_complete(
+            safe.acheck_many(['Password1'], guesses=True)
+        )
+        assert list(batch.messages) == [safe.GUESS_TERRIBLE]
+    finally:
+        loop.close()
+        safe._wordlist = holder
+        safe.aio._wordlist = holder
+
+
+def test_audit():
+    from safe.audit import audit
+
+    passwords = ['password', 'yhnolkuT.', 'yhnolkuT', '1'] * 50
+    for workers in (1, 2):
+        offsets = []
+        valid = []
+        for offset, batch in audit(passwords, workers=workers, chunk_size=7):
+            offsets.append(offset)
+            valid.extend(batch.valid)
+        assert offsets == list(range(0, 200, 7))
+        assert valid == [0, 1, 0, 0] * 50
+
+    cache = safe.VerdictCache()
+    for workers in (1, 2):
+        batches = [batch for _, batch in audit(
+            ['Password1'], workers=workers, guesses=True, cache=cache
+        )]
+        assert list(batches[0].messages) == [safe.GUESS_TERRIBLE]
+    assert cache.stats()['misses'] == 1
+
+
+def test_command_line():
+    import gzip
+    import json
+    from safe.__main__ import main
+
+    dirname = tempfile.mkdtemp()
+    source = os.path.join(dirname, 'passwords.gz')
+    output = os.path.join(dirname, 'verdicts.jsonl')
+    with gzip.open(source, 'wb') as f:
+        f.write(b'password\nyhnolkuT.\nyhnolkuT\n')
+    main([source, '-o', output, '-w', '1', '--level', 'medium'])
+    with open(output) as f:
+        verdicts = [json.loads(line) for line in f]
+    assert [v['index'] for v in verdicts] == [0, 1, 2]
+    assert [v['valid'] for v in verdicts] == [False, True, True]
+    assert verdicts[2]['strength'] == 'medium'
+
+    import csv
+    output = os.path.join(dirname, 'verdicts.csv')
+    main([source, '-o', output, '-w', '1', '-f', 'csv'])
+    with open(output) as f:
+        rows = list(csv.reader(f))
+    assert all(len(row) == 4 for row in rows)
+    assert rows[3] == [
+        '2', '0', 'medium', 'password is good enough, but not strong'
+    ]
+
+
+def test_policy():
+    policy = safe.Policy(length=7, level=safe.MEDIUM)
+    for raw in ['1', 'password', 'yhnolku', 'yhnolkuT', 'yhnolkuT.']:
+        verdict = policy(raw)
+        expected = safe.check(raw, length=7, level=safe.MEDIUM)
+        assert bool(verdict) == bool(expected)
+        assert repr(verdict) == repr(expected)
+        assert str(verdict) == str(expected)
+    assert policy('yhnolkuT') is policy('yhnolkuTT')
+    try:
+        policy('password').valid = True
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError('verdict should be immutable')
+    assert not policy('password').valid
+
+
+def test_keyboard_walks():
+    from safe import keyboard
+
+    assert keyboard.walk_coverage('1qaz2wsx') == 1.0
+    assert keyboard.walk_coverage('7896321') == 1.0
+    assert keyboard.walk_coverage('aoeuidhtns') == 1.0
+    assert keyboard.walk_coverage('yhnolkuT.') == 0.0
+    assert keyboard.walk_coverage('xqwerx') == 4 / 6.0
+    walks = keyboard.find_walks('zaq!xsw@', layouts=['qwerty'])
+    assert walks == [(0, 4, 'qwerty'), (4, 8, 'qwerty')]
+
+    for raw in ['1qaz2wsx', '!QAZ@WSX', 'azertyuiop', '8524563']:
+        s = safe.check(raw, length=7)
+        assert 'pattern' in s.message
+    assert safe.check('7ujm8ik,', walk_ratio=1.1, min_types=2)
+    assert 'pattern' in safe.check('7ujm8ik,', min_types=2).message
+
+
+def test_dictionary():
+    from safe.dictionary import Automaton
+
+    automaton = Automaton.build({u'monkey': 10, u'dragon': 20, u'key': 5})
+    assert automaton.find('xMonkeyx') == set([(1, 7, 10), (4, 7, 5)])
+    assert automaton.find('dr@g0n') == set([(0, 6, 20)])
+    assert automaton.find('dr@g0n', leet=False) == set()
+    assert automaton.coverage('monkeydragon') == 1.0
+    assert automaton.coverage('monkey!!') == 0.75
+
+    filename = os.path.join(tempfile.mkdtemp(), 'words.ac')
+    with open(filename, 'wb') as f:
+        automaton.save(f)
+    loaded = Automaton.load(filename)
+    assert loaded.find('xMonkeyx') == automaton.find('xMonkeyx')
+
+    for raw in ['monkeydragon', 'P@ssw0rd2024!', 'Sunshine#1']:
+        s = safe.check(raw, word_ratio=safe.WORD_RATIO)
+        assert 'common' in s.message
+    # it is disabled by default
+    assert safe.check('P@ssw0rd2024!')
+    assert safe.check('P@ssw0rd2024!', word_ratio=1.1)
+
+
+def test_guesses():
+    from safe.scoring import estimate
+
+    guesses, patterns = estimate('P@ssw0rd2024!', safe._automaton.get())
+    assert guesses < 6
+    assert [p[2] for p in patterns] == ['dictionary', 'date', 'bruteforce']
+    guesses, patterns = estimate('abcdefgh')
+    assert patterns == [(0, 8, 'sequence', guesses)]
+    assert estimate('zzzzzzzz')[1][0][2] == 'repeat'
+    assert estimate('kj3$9Lm!qZ')[0] == 10
+
+    s = safe.check('Password1', guesses=True)
+    assert repr(s) == 'terrible'
+    assert not s
+    s = safe.check('monkeydragon', guesses=True, level=safe.TERRIBLE)
+    assert s and repr(s) == 'terrible'
+    assert repr(safe.check('P@ssw0rd2024!', guesses=True)) == 'simple'
+    assert safe.check('kj3$9Lm!qZ', guesses=True)
+
+
+def test_max_length():
+    s = safe.check(u'yhnolkuT.' * 100, max_length=20, truncate=False)
+    assert not s
+    assert 'long' in s.message
+    assert safe.check(u'yhnolkuT.' * 100, max_length=20)
+    s = safe.check(u'password' + u'x' * 300, word_ratio=safe.WORD_RATIO)
+    assert 'common' in s.message
+
+
+def test_bounded_latency():
+    import time
+    import random
+    from safe._compat import unichr
+
+    rnd = random.Random(42)
+    adversarial = [
+        u'a' * 1000000,
+        u'x*V-92Ba' * 100000,
+        u'qwertyuiop' * 100000,
+        u'abcdefghijklmnopqrstuvwxyz' * 40000,
+        u'\U0001f600\U0001f601' * 500000,
+        u''.join(unichr(rnd.randint(0x10000, 0x10ffff))
+                for _ in range(10000)),
+        u'password' * 100000,
+        u'P@ssw0rd2024!' * 80000,
+    ]
+    for raw in adversarial:
+        for guesses in (False, True):
+            start = time.time()
+            safe.check(raw, guesses=guesses)
+            assert time.time() - start < 0.1, raw[:20]